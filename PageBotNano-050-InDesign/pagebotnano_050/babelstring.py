@@ -15,33 +15,356 @@
 #
 import sys
 sys.path.insert(0, "..") # So we can import pagebotnano without installing.
+from array import array
+from bisect import bisect_right
 from copy import copy
+from html import escape
+import marshal
+from weakref import WeakValueDictionary
 import drawBot
 
-from pagebotnano.toolbox.color import Color
+from pagebotnano.toolbox.color import Color, NoColor, undefinedColor
 from pagebotnano.constants import (EN, FS_ATTRIBUTES, CSS_ATTRIBUTES, 
     HTML_TEXT_TAGS)
 
+def _hashableValue(value):
+    """Answer a hashable representation of a style value, so styles with equal
+    values get the same key in the style registry. Color instances are not 
+    hashable, so they are represented by their defining attributes.
+
+    >>> _hashableValue('Georgia')
+    'Georgia'
+    >>> _hashableValue([10, 20, dict(a=1)])
+    (10, 20, frozenset({('a', 1)}))
+    >>> _hashableValue(Color(1, 0, 0)) == _hashableValue(Color(1, 0, 0))
+    True
+    """
+    if isinstance(value, Color):
+        return (Color, value.r, value.g, value.b, value.a, value.c, value.m, 
+            value.y, value.k, value._spot, value._ral, value._name, value.tint)
+    if isinstance(value, (list, tuple)):
+        return tuple(_hashableValue(v) for v in value)
+    if isinstance(value, dict):
+        return frozenset((name, _hashableValue(v)) for name, v in value.items())
+    try:
+        hash(value)
+    except TypeError: # Unknown unhashable value, then only identical objects match.
+        return (id, id(value))
+    return value
+
+class Style(dict):
+    """Immutable and hashable style dictionary. Style instances are interned
+    by the registry of internStyle(), so there is only one instance for each
+    distinct style. That makes comparing the styles of runs an identity check.
+    Reading is identical to a normal dict. Use copy(style) to get a mutable 
+    dict that can be altered.
+
+    >>> style = internStyle(dict(font='Georgia', fontSize=12))
+    >>> style
+    {'font': 'Georgia', 'fontSize': 12}
+    >>> style is internStyle(dict(fontSize=12, font='Georgia'))
+    True
+    >>> style['font'] = 'Verdana'
+    Traceback (most recent call last):
+        ...
+    TypeError: Style is immutable
+    >>> d = copy(style) # Mutable copy
+    >>> d['font'] = 'Verdana'
+    >>> d.__class__.__name__, internStyle(d)['font']
+    ('dict', 'Verdana')
+    """
+    __slots__ = ('_key', '_hash', '_compiled', '__weakref__')
+
+    def __init__(self, style, key):
+        dict.__init__(self, style)
+        self._key = key
+        self._hash = hash(key)
+        self._compiled = {} # Translations of self for output backends.
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, style):
+        if isinstance(style, Style):
+            return self is style or self._key == style._key
+        return dict.__eq__(self, style)
+
+    def __ne__(self, style):
+        return not self == style
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError('%s is immutable' % self.__class__.__name__)
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = __ior__ = _immutable
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return dict(self)
+
+    def __reduce__(self):
+        # Unpickled styles are interned again in the receiving process.
+        return internStyle, (dict(self),)
+
+    def compiled(self, backend, translate):
+        """Answer the translation of self for the `backend` output, such as
+        DrawBot FormattedString attributes or CSS declarations. The 
+        translate(style) function is only called once for each distinct
+        style, then the result is reused by all runs and rebuilds.
+        The answered translation should be treated as read-only.
+
+        >>> style = internStyle(dict(font='Georgia', fontSize=12, tag='p'))
+        >>> fsStyle = style.compiled('fs', getFSStyle)
+        >>> fsStyle
+        {'font': 'Georgia', 'fontSize': 12}
+        >>> fsStyle is internStyle(dict(tag='p', font='Georgia', fontSize=12)).compiled('fs', getFSStyle)
+        True
+        """
+        translation = self._compiled.get(backend)
+        if translation is None:
+            self._compiled[backend] = translation = translate(self)
+        return translation
+
+# Registry of interned Style instances by their key. Styles that are no 
+# longer used by any run are removed automatically.
+STYLES = WeakValueDictionary()
+
+def internStyle(style):
+    """Answer the unique Style instance that is equal to the `style` dict.
+    If `style` is None or already a Style, then answer it unchanged.
+
+    >>> s1 = internStyle(dict(font='Georgia', fill=Color(1, 0, 0)))
+    >>> s2 = internStyle(dict(font='Georgia', fill=Color(1, 0, 0)))
+    >>> s1 is s2
+    True
+    >>> internStyle(s1) is s1
+    True
+    >>> internStyle(None) is None
+    True
+    """
+    if style is None or isinstance(style, Style):
+        return style
+    key = frozenset((name, _hashableValue(value)) for name, value in style.items())
+    interned = STYLES.get(key)
+    if interned is None:
+        STYLES[key] = interned = Style(style, key)
+    return interned
+
+def getFSStyle(style):
+    """Answer a style dict that only contains names that are allowed 
+    in the DrawBot.FormattedString attributes, with Color values as rgb.
+
+    >>> getFSStyle(dict(font='Georgia', fill=Color(1, 0, 0), tag='h1'))
+    {'font': 'Georgia', 'fill': (1, 0, 0)}
+    """
+    fsStyle = {}
+    for name, value in style.items(): # Only copy what is allowed in FS
+        if name in FS_ATTRIBUTES:
+            if isinstance(value, Color):
+                value = value.rgb
+            fsStyle[name] = value
+    return fsStyle
+
+def getCssStyle(style):
+    """Answer the (tag, class, declarations) tuple of a style, to be used
+    by Css. The declarations only contain the names in CSS_ATTRIBUTES.
+
+    >>> getCssStyle(dict(font='Georgia', tag='h1', name='top', language='en'))
+    ('h1', 'top', (('font', 'Georgia'),))
+    """
+    declarations = tuple((name, value) for name, value in style.items()
+        if name in CSS_ATTRIBUTES)
+    return style.get('tag', 'span'), style.get('name'), declarations
+
+def getHtmlTags(style):
+    """Answer the (open, close) html tags of a style. Default tag is <span>.
+
+    >>> getHtmlTags(dict(tag='h1', name='"top"'))
+    ('<h1 class="&quot;top&quot;">', '</h1>')
+    >>> getHtmlTags({})
+    ('<span>', '</span>')
+    """
+    tag = style.get('tag', 'span')
+    if 'name' in style:
+        return '<%s class="%s">' % (tag, escape(str(style['name']))), '</%s>' % tag
+    return '<%s>' % tag, '</%s>' % tag
+
+#   S E R I A L I Z A T I O N
+
+# Versioned header of serialized strings and galleys. Increment the version
+# if the payload layout changes, so older data is refused instead of misread.
+SERIALIZE_MAGIC = b'PBNB'
+SERIALIZE_VERSION = 2
+# Byte order of the run length arrays, swapped on loading if different.
+BYTE_ORDER = {'little': b'<', 'big': b'>'}[sys.byteorder]
+
+COLOR_CLASSES = {'Color': Color, 'NoColor': NoColor}
+
+def encodeValue(value):
+    """Answer a value that can be written by marshal. Color instances are
+    encoded by their class name and attributes, all other values are 
+    answered unchanged.
+
+    >>> encodeValue(12)
+    (0, 12)
+    >>> c = decodeValue(encodeValue(Color(1, 0, 0)))
+    >>> c, c == Color(1, 0, 0)
+    (Color(r=1, g=0, b=0), True)
+    >>> decodeValue(encodeValue(undefinedColor)) is undefinedColor # Stays shared
+    True
+    """
+    if isinstance(value, Color):
+        return 1, (value.__class__.__name__, vars(value))
+    return 0, value
+
+def decodeValue(encoded):
+    kind, value = encoded
+    if kind == 1:
+        className, attributes = value
+        if className == 'UndefinedColor':
+            return undefinedColor
+        value = COLOR_CLASSES[className].__new__(COLOR_CLASSES[className])
+        value.__dict__.update(attributes)
+    return value
+
+def packStyles(styleIds):
+    """Answer the style table as tuple of encoded styles, ordered by the
+    ids in the `styleIds` dictionary of {style: id}.
+    """
+    styles = sorted(styleIds, key=styleIds.get)
+    return tuple(tuple((name, encodeValue(value)) for name, value in style.items()) 
+        for style in styles)
+
+def unpackStyles(packed):
+    """Answer the list of interned Style instances from a packed style table.
+
+    >>> styles = unpackStyles(packStyles({internStyle(dict(font='Georgia')): 0}))
+    >>> styles, styles[0] is internStyle(dict(font='Georgia'))
+    ([{'font': 'Georgia'}], True)
+    """
+    return [internStyle({name: decodeValue(value) for name, value in style})
+        for style in packed]
+
+def packString(bs, styleIds):
+    """Answer the columns of BabelString `bs` packed as (text, lengths, ids)
+    tuple. The lengths and style ids of the runs are arrays, stored as bytes.
+    New styles are added to the `styleIds` dictionary, that can be shared 
+    by multiple strings.
+
+    >>> styleIds = {}
+    >>> bs = BabelString('Hello ', dict(font='Georgia'))
+    >>> bs.append('world', dict(font='Verdana'))
+    >>> text, lengths, ids = packString(bs, styleIds)
+    >>> text, len(styleIds)
+    ('Hello world', 2)
+    >>> bs2 = unpackString((text, lengths, ids), unpackStyles(packStyles(styleIds)))
+    >>> [(run.s, run.style['font']) for run in bs2.runs]
+    [('Hello ', 'Georgia'), ('world', 'Verdana')]
+    """
+    if bs._source is not None: # Views first copy their range into columns.
+        bs = BabelString.fromRuns(bs._iterRuns())
+    ids = array('I', [styleIds.setdefault(bs._styles[styleId], len(styleIds)) 
+        for styleId in bs._runStyleIds])
+    return bs._getText(), bs._runLengths.tobytes(), ids.tobytes()
+
+def unpackString(packed, styles, byteOrder=BYTE_ORDER):
+    """Answer a new BabelString from the packed columns. `styles` is the 
+    list of Style instances, as answered by unpackStyles().
+    """
+    text, lengthBytes, idBytes = packed
+    lengths = array('I', lengthBytes)
+    ids = array('I', idBytes)
+    if byteOrder != BYTE_ORDER:
+        lengths.byteswap()
+        ids.byteswap()
+    bs = BabelString()
+    bs._setColumns(text, lengths, [styles[styleId] for styleId in ids])
+    return bs
+
+def dumpPayload(payload):
+    """Answer the payload as bytes, preceded by the versioned header.
+
+    >>> data = dumpPayload(('text', 1))
+    >>> data[:6]
+    b'PBNB\\x02<'
+    >>> loadPayload(data)
+    (('text', 1), b'<')
+    >>> loadPayload(b'PBNB\\x00<')
+    Traceback (most recent call last):
+        ...
+    ValueError: loadPayload: Unsupported serialization format
+    """
+    # Marshal version 2 writes no references to shared objects, so equal 
+    # payloads always answer equal bytes.
+    return SERIALIZE_MAGIC + bytes((SERIALIZE_VERSION,)) + BYTE_ORDER + marshal.dumps(payload, 2)
+
+def loadPayload(data):
+    """Answer the (payload, byteOrder) tuple from the serialized data."""
+    if data[:4] != SERIALIZE_MAGIC or data[4] != SERIALIZE_VERSION:
+        raise ValueError('loadPayload: Unsupported serialization format')
+    return marshal.loads(data[6:]), data[5:6]
+
 class BabelRun:
-    """Holds a plain string with a style.
+    """Holds a plain string with a style. The string is stored as a list of
+    chunks (a simple rope), so appending to a run does not copy the text that
+    is already there. The chunks are joined only once, when run.s is requested.
+    The style is interned as immutable Style instance, shared by all runs
+    that have the same style. BabelString does not store its runs as 
+    BabelRun instances. They are created on request of BabelString.runs.
+
+    >>> br = BabelRun('Hello', dict(font='Georgia'))
+    >>> br.append(' world')
+    >>> br.append('s')
+    >>> len(br._chunks)
+    3
+    >>> br.s
+    'Hello worlds'
+    >>> len(br._chunks) # Joined chunks are kept, so this happens only once.
+    1
     """
+    __slots__ = ('_chunks', '_style', 'frozen')
+
     def __init__(self, s, style):
-        self.s = s # Property that clear the native cache components of a string.
-        self.style = style
+        self.frozen = False # Set for the read-only runs answered by BabelString.runs
+        self.s = s # Property that stores the string as single chunk.
+        self.style = style # Property that stores the interned style.
+
+    def _get_s(self):
+        if len(self._chunks) > 1:
+            self._chunks = [''.join(self._chunks)]
+        return self._chunks[0]
+    def _set_s(self, s):
+        assert not self.frozen, ('%s.s: Run is frozen' % self.__class__.__name__)
+        self._chunks = [s]
+    s = property(_get_s, _set_s)
+
+    def _get_style(self):
+        return self._style
+    def _set_style(self, style):
+        assert not self.frozen, ('%s.style: Run is frozen' % self.__class__.__name__)
+        self._style = internStyle(style)
+    style = property(_get_style, _set_style)
+
+    def append(self, s):
+        """Add the string `s` as new chunk to the end of the run, without
+        copying the existing text. Amortized O(1).
+        """
+        assert not self.frozen, ('%s.append: Run is frozen' % self.__class__.__name__)
+        self._chunks.append(s)
 
     def copy(self):
-        """Answer a copy of self, where also the style is copied.
+        """Answer a copy of self, that is not frozen. The immutable style is shared.
 
         >>> br = BabelRun('Hello world', dict(font='Georgia'))
         >>> br2 = br.copy()
         >>> br.s == br2.s and br.style == br2.style # Copy is equal
         True
-        >>> br.style is not br2.style
+        >>> br.style is br2.style
         True
         >>> br
         <BabelRun s=Hello world>
         """
-        return self.__class__(self.s, copy(self.style))
+        return self.__class__(self.s, self.style)
 
     def __repr__(self):
         return '<%s s=%s>' % (self.__class__.__name__, self.s[:20])
@@ -60,10 +383,25 @@ class Css:
         return '<%s style=%s>' % (self.__class__.__name__, len(self.styles))
 
     def getMergedStyles(self):
+        """Answer the dict of merged styles by tag. Styles are interned, so a
+        style that is identical to the previous one merged into the same tag
+        is skipped, as it would not change the result.
+
+        >>> css = Css()
+        >>> for n in range(3):
+        ...     css.append(dict(tag='p', font='Georgia'))
+        ...     css.append(dict(tag='h1', font='Georgia-Bold'))
+        >>> sorted(css.getMergedStyles().items())
+        [('h1', {'class_': None, 'tag': 'h1', 'font': 'Georgia-Bold'}), ('p', {'class_': None, 'tag': 'p', 'font': 'Georgia'})]
+        """
         merged = {} # First merge equal styles for defined tags
+        lastStyles = {} # Last style that was merged for each tag.
         for style in self.styles:
-            tag = style.get('tag', 'span')
-            class_ = style.get('name')
+            style = internStyle(style)
+            tag, class_, _ = style.compiled('css', getCssStyle)
+            if lastStyles.get(tag) is style:
+                continue
+            lastStyles[tag] = style
             if tag in HTML_TEXT_TAGS:
                 cssStyle = dict(class_=class_)
                 if tag not in merged:
@@ -72,63 +410,284 @@ class Css:
                     merged[tag][cssName] = value
         return merged
 
-    def asString(self, compact=False):
+    def iterCss(self, compact=False):
+        """Generate the css source as fragments, one for each rule, so it can
+        be written directly into a file.
+
+        >>> css = Css()
+        >>> css.append(dict(tag='p', font='Georgia'))
+        >>> css.append(dict(tag='h1', font='Georgia-Bold', fontSize=24))
+        >>> list(css.iterCss(compact=True))
+        ['h1 {font:Georgia-Bold;fontSize:24;};\\n', 'p {font:Georgia;};\\n']
+        """
         if compact:
             r = t = s = ''
         else:
             r = '\n'
             t = '\t'
             s = ' '
-        css = ''
         for tag, style in sorted(self.getMergedStyles().items()):
             class_ = style.get('class_')
-            css += tag
+            rule = [tag]
             if class_ is not None:
-                css += '.'+class_
-            css += ' {'
-            for cssName, value in style.items():
-                if cssName in CSS_ATTRIBUTES:
-                    # TODO: make better representations of the CSS value
-                    css += '%s%s:%s%s;%s' % (t, cssName, s, value, r)
-            css += '};\n'
-        return css
+                rule.append('.'+class_)
+            rule.append(' {')
+            # Only the CSS_ATTRIBUTES are used from the merged style.
+            _, _, declarations = internStyle(style).compiled('css', getCssStyle)
+            for cssName, value in declarations:
+                # TODO: make better representations of the CSS value
+                rule.append('%s%s:%s%s;%s' % (t, cssName, s, value, r))
+            rule.append('};\n')
+            yield ''.join(rule)
+
+    def asString(self, compact=False):
+        return ''.join(self.iterCss(compact))
 
 class BabelString:
     """The BabelString is a wrapper around native string formats, such as
     DrawBot.FormattedString. While supporting the full API (=interface)
     of a FormattedString, it can also support other formats, such as HTML/CSS
     when text comes from a markdown file or should generate HTML/CSS.
+    The runs are stored in columns: one text buffer, with parallel arrays
+    of the offset, length and style id of each run. BabelRun instances are
+    only created when bs.runs is requested.
 
     >>> bs = BabelString('Hello world', dict(font='Georgia', fontSize=24, name='h1'))
     >>> bs
     <BabelString runs=1>
     >>> bs.fs # Generates a DrawBot.FormattedString
     Hello world
-    >>> bs += 's' # Add to the last run, no style change. Reset DrawBot cache.
-    >>> bs.fs # Generates a new DrawBot.FormattedString
+    >>> bs += 's' # Add to the last run, no style change. Extends DrawBot cache.
+    >>> bs.fs # The same DrawBot.FormattedString, extended in place.
     Hello worlds
     >>> bs.append(' and other planets', dict(font='Georgia-Bold', fontSize=18))
     >>> bs # This added a new run
     <BabelString runs=2>
-    >>> bs.fs, bs.fs.__class__.__name__ # New DrawBot.FormattedString created.
+    >>> bs.fs, bs.fs.__class__.__name__ # Cached DrawBot.FormattedString extended.
     (Hello worlds and other planets, 'FormattedString')
+    >>> bs[6:18] # Slicing answers a view, sharing the columns of bs.
+    <BabelString runs=2>
+    >>> bs[6:18].fs
+    worlds and o
     """
+    __slots__ = ('_chunks', '_length', '_runOffsets', '_runLengths', 
+        '_runStyleIds', '_styles', '_styleIds', '_runs', '_source', '_start', 
+        '_end', 'frozen', '_owners', '_fs', '_html', '_css')
+
     def __init__(self, s=None, style=None, **kwargs):
         if s is None:
             s = ''
         if style is None:
             style = {}
-        else:
+        elif kwargs:
             # Make a copy, as we are altering it with **kwargs attributes
-            style = copy(style) 
+            style = dict(style) 
         for name, value in kwargs.items():
             style[name] = value
-        self.runs = [] # List of BabelRun instances.
-        self.append(s, style)
+        self._chunks = [] # Text buffer of all runs, as list of chunks.
+        self._length = 0 # Total number of characters in the text buffer.
+        self._runOffsets = array('Q') # Start of each run in the text buffer.
+        self._runLengths = array('I') # Number of characters of each run.
+        self._runStyleIds = array('I') # Index of the style of each run in self._styles.
+        self._styles = [] # Table of the interned styles that are used by the runs.
+        self._styleIds = {} # Index of each style in self._styles.
+        self._runs = None # Cached list of BabelRun instances, created on request.
+        # If self is a view, then _source is the BabelString that owns the runs
+        # and (_start, _end) is the range of characters in the source.
+        self._source = None
+        self._start = self._end = 0
+        self.frozen = False # Set by self.freeze() when the string is done.
+        self._owners = None # Elements that show self, see self.addOwner()
         self.reset() # Initialize storage of native cached formatted strings 
+        self.append(s, style)
 
     def __repr__(self):
-        return '<%s runs=%d>' % (self.__class__.__name__, len(self.runs))
+        if self._source is not None:
+            count = len(self.runs)
+        else:
+            count = len(self._runStyleIds)
+        return '<%s runs=%d>' % (self.__class__.__name__, count)
+
+    def __len__(self):
+        """Answer the number of characters in self.
+
+        >>> bs = BabelString('Hello', dict(font='Georgia'))
+        >>> bs.append(' world', dict(font='Georgia-Bold'))
+        >>> len(bs), len(bs[3:8]), len(bs[20:])
+        (11, 5, 0)
+        """
+        if self._source is not None:
+            return self._end - self._start
+        return self._length
+
+    def __getitem__(self, index):
+        """Answer a view on the slice of self. The view refers to the columns
+        of the source string, nothing is copied. A view of a view refers to
+        the original source, so paginating by repeated slicing does not
+        build chains. Appending to a view first copies its range of the 
+        source into columns of its own.
+
+        >>> bs = BabelString('Hello ', dict(font='Georgia'))
+        >>> bs.append('big', dict(font='Georgia-Bold'))
+        >>> bs.append(' world', dict(font='Georgia'))
+        >>> view = bs[2:]
+        >>> [run.s for run in view.runs]
+        ['llo ', 'big', ' world']
+        >>> view2 = view[5:11]
+        >>> view2._source is bs, [run.s for run in view2.runs]
+        (True, ['ig', ' wor'])
+        >>> view2.append('ld')
+        >>> view2.html, bs.html # Source is not changed by appending to the view
+        ('<span>ig</span><span>world</span>', '<span>Hello</span><span>big</span><span>world</span>')
+        >>> bs[-5:].runs[0].s
+        'world'
+        """
+        if not isinstance(index, slice):
+            index = slice(index, index+1 or None)
+        start, end, step = index.indices(len(self))
+        assert step == 1, ('%s: Slicing step must be 1' % self.__class__.__name__)
+        end = max(start, end)
+        view = self.__class__()
+        if self._source is not None:
+            view._source = self._source
+            view._start = self._start + start
+            view._end = self._start + end
+        else:
+            view._source = self
+            view._start = start
+            view._end = end
+        return view
+
+    def _getText(self):
+        """Answer the text buffer as a single string. The chunks are joined
+        only when there is more than one.
+        """
+        if len(self._chunks) != 1:
+            self._chunks = [''.join(self._chunks)]
+        return self._chunks[0]
+
+    def _getStyleId(self, style):
+        """Answer the index of the interned `style` in the style table of
+        self. Add the style to the table if it is not there yet.
+        """
+        styleId = self._styleIds.get(style)
+        if styleId is None:
+            self._styleIds[style] = styleId = len(self._styles)
+            self._styles.append(style)
+        return styleId
+
+    def _setColumns(self, text, lengths, styles):
+        """Set the columns of self from the `text` buffer, the list of `lengths`
+        and the list of interned `styles` of the runs.
+        """
+        self._chunks = [text]
+        self._length = len(text)
+        self._styles = []
+        self._styleIds = {}
+        self._runOffsets = offsets = array('Q')
+        offset = 0
+        for length in lengths:
+            offsets.append(offset)
+            offset += length
+        self._runLengths = array('I', lengths)
+        self._runStyleIds = array('I', [self._getStyleId(style) for style in styles])
+        self._runs = None
+        self._ownersChanged()
+
+    def _iterRange(self, start, end):
+        """Generate the (s, style) tuples of the runs that cover the range
+        (start, end) of characters in the columns of self. The runs on the 
+        boundaries are answered partially.
+        """
+        if start >= end:
+            return
+        text = self._getText()
+        offsets = self._runOffsets
+        lengths = self._runLengths
+        styleIds = self._runStyleIds
+        index = max(0, bisect_right(offsets, start) - 1)
+        while index < len(offsets) and offsets[index] < end:
+            offset = offsets[index]
+            yield (text[max(start, offset):min(end, offset + lengths[index])], 
+                self._styles[styleIds[index]])
+            index += 1
+
+    def _iterRuns(self):
+        """Answer an iterator with the (s, style) tuple of each run, without
+        creating BabelRun instances. If self is a view, then the runs are
+        read from the columns of the source.
+        """
+        if self._source is not None:
+            return self._source._iterRange(self._start, self._end)
+        text = self._getText()
+        styles = self._styles
+        return ((text[offset:offset+length], styles[styleId]) for offset, length, styleId 
+            in zip(self._runOffsets, self._runLengths, self._runStyleIds))
+
+    def _getRun(self, index):
+        """Answer the (s, style) tuple of the run at `index` in the columns."""
+        offset = self._runOffsets[index]
+        return (self._getText()[offset:offset + self._runLengths[index]], 
+            self._styles[self._runStyleIds[index]])
+
+    def _materialize(self):
+        """Copy the range of the source into columns of self, so self is no
+        longer a view. The native caches stay valid, as the runs are equal.
+        """
+        runs = list(self._iterRuns())
+        self._source = None
+        self._setColumns(''.join(s for s, _ in runs), [len(s) for s, _ in runs],
+            [style for _, style in runs])
+
+    def _get_runs(self):
+        """Answer the tuple of BabelRun instances, created from the columns
+        once, on request. The runs are a read-only snapshot, they are frozen, 
+        so changing them raises an error instead of silently not altering 
+        self. Use BabelString.fromRuns() to create a changed string, or 
+        run.copy() for a run that can be changed.
+
+        >>> bs = BabelString('Hello', dict(font='Georgia'))
+        >>> bs.runs
+        (<BabelRun s=Hello>,)
+        >>> bs.runs[0].append(' world')
+        Traceback (most recent call last):
+            ...
+        AssertionError: BabelRun.append: Run is frozen
+        >>> bs.runs[0].style = dict(font='Verdana')
+        Traceback (most recent call last):
+            ...
+        AssertionError: BabelRun.style: Run is frozen
+        >>> bs.runs.append(BabelRun('!', {}))
+        Traceback (most recent call last):
+            ...
+        AttributeError: 'tuple' object has no attribute 'append'
+        >>> run = bs.runs[0].copy()
+        >>> run.append(' world')
+        >>> BabelString.fromRuns(bs.runs + (run,)).runs[0].s
+        'HelloHello world'
+        """
+        if self._runs is None:
+            runs = []
+            for s, style in self._iterRuns():
+                run = BabelRun(s, style)
+                run.frozen = True
+                runs.append(run)
+            self._runs = tuple(runs)
+        return self._runs
+    runs = property(_get_runs)
+
+    def _get_s(self):
+        """Answer the plain text of self, without styles.
+
+        >>> bs = BabelString('Hello ', dict(font='Georgia'))
+        >>> bs.append('world', dict(font='Georgia-Bold'))
+        >>> bs.s, bs[3:8].s
+        ('Hello world', 'lo wo')
+        """
+        if self._source is not None:
+            return self._source._getText()[self._start:self._end]
+        return self._getText()
+    s = property(_get_s)
 
     def __add__(self, s):
         """Add `s` to self. If `s` is another BabelString, then copy all of
@@ -141,15 +700,44 @@ class BabelString:
         >>> bs.fs
         Hello worlds and other planets
         """
-        if isinstance(s, self.__class__):
-            for run in s.runs:
-                self.append(run.s, run.style)
-        elif isinstance(s, str):
+        if isinstance(s, (self.__class__, str)):
             self.append(s)
         else:
             self.append(str(s))
         return self
 
+    def addOwner(self, e):
+        """Add the element `e` to the owners of self, that are notified by 
+        calling e.changed() when self is altered, e.g. by appending. The Text
+        element adds itself, so altering its BabelString in place makes the
+        page dirty. A view is also owned through its source.
+
+        >>> from pagebotnano.elements import Element
+        >>> bs = BabelString('Hello')
+        >>> e = Element()
+        >>> bs[1:].addOwner(e)
+        >>> e.dirty = False # As if built
+        >>> bs.append(' world')
+        >>> e.dirty
+        True
+        """
+        for owned in (self, self._source):
+            if owned is not None:
+                if owned._owners is None:
+                    owned._owners = {} # Used as ordered set.
+                owned._owners[e] = None
+
+    def removeOwner(self, e):
+        """Remove the element `e` from the owners of self, if it is there."""
+        for owned in (self, self._source):
+            if owned is not None and owned._owners:
+                owned._owners.pop(e, None)
+
+    def _ownersChanged(self):
+        if self._owners:
+            for e in self._owners:
+                e.changed()
+
     def _get_hyphenation(self):
         """Run through all run.style, untile a setting for hyphenation is found.
         That value is the answered boolean. Unfortunately OSX does not allow
@@ -162,23 +750,44 @@ class BabelString:
         >>> bs.hyphenation = False
         >>> bs.runs[0].style['hyphenation']
         False
+        >>> bs.runs[0].style is internStyle(dict(hyphenation=False))
+        True
         >>> bs = BabelString('Hello world', dict(hyphenation=True))
         >>> bs.hyphenation
         True
+        >>> bs[6:].hyphenation # Views answer the flag of their source.
+        True
+        >>> bs = bs.freeze()
+        >>> bs.hyphenation = False
+        Traceback (most recent call last):
+            ...
+        AssertionError: BabelString.hyphenation: String is frozen
         """
-        for run in self.runs:
-            if 'hyphenation' in run.style:
-                return run.style['hyphenation']
+        if self._source is not None:
+            return self._source.hyphenation
+        for styleId in self._runStyleIds:
+            style = self._styles[styleId]
+            if 'hyphenation' in style:
+                return style['hyphenation']
         return False
     def _set_hyphenation(self, flag):
-        if self.runs:
-            self.runs[0].style['hyphenation'] = flag
+        assert not self.frozen, ('%s.hyphenation: String is frozen' % self.__class__.__name__)
+        if self._source is not None:
+            self._materialize()
+        if self._runStyleIds:
+            style = self._styles[self._runStyleIds[0]]
+            self._runStyleIds[0] = self._getStyleId(internStyle(dict(style, hyphenation=flag)))
+            self._runs = None
+            self._ownersChanged()
+            self.reset() # Restyling is a structural change of the caches.
     hyphenation = property(_get_hyphenation, _set_hyphenation)
 
     def append(self, bs, style=None):
         """Append the string s to self. If not style is defined, then just add
         the `s` to the last run (inheriting the current style).
-        Otherwise create a new BabelRun to store that `s` string with the style.
+        Otherwise create a new run to store that `s` string with the style.
+        Native caches that already exist are extended in place, instead of
+        being rebuilt from all runs on the next request.
 
         >>> bs = BabelString('Hello world')
         >>> bs
@@ -194,41 +803,152 @@ class BabelString:
         >>> bs 
         <BabelString runs=3>
         """
+        assert not self.frozen, ('%s.append: String is frozen' % self.__class__.__name__)
+        if self._source is not None:
+            # Appending to a view, copy the runs first, to keep the source unaltered.
+            self._materialize()
         if isinstance(bs, self.__class__):
-            for run in bs.runs:
-                if self.runs[-1].style == run.style:
-                    # Identical style, just add to last run or self
-                    self.runs[-1].s += run.s 
-                else:
-                    self.runs.append(run.copy())
+            for s, style in list(bs._iterRuns()):
+                self._appendRun(s, style)
+        else:
+            self._appendRun(str(bs), style)
+
+    def _appendRun(self, s, style):
+        """Add `s` to the last run if the style is undefined or identical. 
+        Otherwise add a new run to the columns. Since styles are interned,
+        comparing them is an identity check. Then extend the native caches
+        that already exist, so they grow with the string.
+
+        >>> bs = BabelString('Hello', dict(tag='h1'))
+        >>> bs.html, bs.css
+        ('<h1>Hello</h1>', <Css style=1>)
+        >>> bs.append(' world')
+        >>> bs.html # Only the fragment of the last run is rebuilt.
+        '<h1>Hello world</h1>'
+        >>> bs.append('Text', dict(tag='p'))
+        >>> bs.html, bs.css # New run, caches are extended.
+        ('<h1>Hello world</h1><p>Text</p>', <Css style=2>)
+        >>> bs._runOffsets, bs._runLengths, bs._runStyleIds
+        (array('Q', [0, 11]), array('I', [11, 4]), array('I', [0, 1]))
+        """
+        style = internStyle(style)
+        styleIds = self._runStyleIds
+        if styleIds and (style is None or self._styles[styleIds[-1]] is style):
+            # Undefined style or identical style, just add to last run
+            self._runLengths[-1] += len(s)
+            isNewRun = False
         else:
-            if style is None or (self.runs and self.runs[-1].style == style):
-                # Undefined style or identical style, just add to last run
-                self.runs[-1].s += str(bs) 
+            self._runOffsets.append(self._length)
+            self._runLengths.append(len(s))
+            styleIds.append(self._getStyleId(style or internStyle({})))
+            isNewRun = True
+        style = self._styles[styleIds[-1]]
+        if s:
+            self._chunks.append(s)
+            self._length += len(s)
+        self._runs = None
+        self._ownersChanged()
+
+        if self._fs is not None:
+            fsStyle = self._getFSStyle(style)
+            self._fs.append(drawBot.FormattedString(s, **fsStyle))
+        if self._html is not None:
+            # Mark the html fragment of the run to be rebuilt on request.
+            if isNewRun:
+                self._html.append(None)
             else:
-                self.runs.append(BabelRun(str(bs), style))
-        self.reset()
+                self._html[-1] = None
+        if self._css is not None and isNewRun:
+            self._css.append(style)
 
     def reset(self):
+        """Clear the native caches. This only is needed for structural changes,
+        such as restyling runs. Appending to the string extends the existing 
+        caches instead.
+        """
         self._fs = None # Storage of DrawBot.FormattedString
-        self._html = None # Storage of html string representation.
+        self._html = None # Storage of html fragments, one for each run.
         self._css = None # Storage Css instance.
 
+    def freeze(self):
+        """Mark the string as done. The chunks of the text buffer are joined
+        once and no more appending is allowed, so the native caches (self.fs,
+        self.html and self.css) are built only once, at first request,
+        and never need to be reset again.
+        Answer self for convenience of the caller.
+
+        >>> bs = BabelString('Hello')
+        >>> for n in range(3):
+        ...     bs.append(' world')
+        >>> bs.freeze() is bs
+        True
+        >>> bs.frozen, bs.runs[0].s
+        (True, 'Hello world world world')
+        >>> bs.append('!')
+        Traceback (most recent call last):
+            ...
+        AssertionError: BabelString.append: String is frozen
+        """
+        if self._source is None:
+            self._getText() # Join the chunks of the text buffer into a single string.
+        self.frozen = True
+        return self
+
+    def asBytes(self):
+        """Answer self serialized into a compact bytes string, with a string
+        table, a style table and the run lengths. Use BabelString.fromBytes()
+        to reconstruct the string.
+
+        >>> bs = BabelString('Hello ', dict(font='Georgia', fill=Color(1, 0, 0)))
+        >>> bs.append('world', dict(font='Georgia-Bold'))
+        >>> bs.append('!', dict(font='Georgia', fill=Color(1, 0, 0)))
+        >>> bs2 = BabelString.fromBytes(bs.asBytes())
+        >>> [(run.s, run.style) for run in bs2.runs] == [(run.s, run.style) for run in bs.runs]
+        True
+        >>> bs2.runs[0].style is bs2.runs[2].style # Styles are interned again
+        True
+        """
+        styleIds = {}
+        packedString = packString(self, styleIds)
+        return dumpPayload((packStyles(styleIds), packedString))
+
+    @classmethod
+    def fromRuns(cls, runs):
+        """Answer a new BabelString from the iterable of (s, style) tuples 
+        or BabelRun instances, in a single pass. Adjacent runs with identical
+        style are merged. If a style is None, then the previous style is used.
+
+        >>> bold = dict(font='Georgia-Bold')
+        >>> bs = BabelString.fromRuns([('Hello ', bold), ('big', bold), (' world', None), ('!', {})])
+        >>> [(run.s, run.style) for run in bs.runs]
+        [('Hello big world', {'font': 'Georgia-Bold'}), ('!', {})]
+        >>> BabelString.fromRuns([]).runs[0].s
+        ''
+        """
+        builder = BabelStringBuilder()
+        for run in runs:
+            if isinstance(run, BabelRun):
+                builder.append(run.s, run.style)
+            else:
+                builder.append(*run)
+        return builder.build(cls)
+
+    @classmethod
+    def fromBytes(cls, data):
+        """Answer a new BabelString, from data created by self.asBytes()."""
+        (packedStyles, packedString), byteOrder = loadPayload(data)
+        return unpackString(packedString, unpackStyles(packedStyles), byteOrder)
+
     def _get_textSize(self):
         return drawBot.textSize(self.fs)
     textSize = property(_get_textSize)
 
     def _getFSStyle(self, style):
         """Answer a style dict that only contains names that are allowed 
-        in the DrawBot.FormattedString attributes.
+        in the DrawBot.FormattedString attributes. The translation is done
+        once for each distinct style.
         """
-        fsStyle = {}
-        for name, value in style.items(): # Only copy what is allowed in FS
-            if name in FS_ATTRIBUTES:
-                if isinstance(value, Color):
-                    value = value.rgb
-                fsStyle[name] = value
-        return fsStyle
+        return internStyle(style).compiled('fs', getFSStyle)
 
     def _get_fs(self):
         """Property that creates a new DrawBot.FormattedString from the
@@ -241,16 +961,16 @@ class BabelString:
         """
         if self._fs is None:
             self._fs = fs = drawBot.FormattedString()
-            for run in self.runs:
-                fsStyle = self._getFSStyle(run.style)
-                fs.append(drawBot.FormattedString(run.s, **fsStyle))
+            for s, style in self._iterRuns():
+                fsStyle = self._getFSStyle(style)
+                fs.append(drawBot.FormattedString(s, **fsStyle))
         return self._fs
     def _set_fs(self, fs):
-        """In case of DrawBot.textBox a DrawBot.FormattedString is answered.
-        An “incomplete” BabelString is constructed by the DrawBotContext,
-        because we cannot reconstruct the source of the string. But the 
-        DrawBot.FormattedString can still be used for placement in Text
-        and TextBox when doc.context is a DrawBotContext.
+        """In case of DrawBot.textBox a DrawBot.FormattedString is answered
+        for the overflow. The DrawBotContext answers a view on the source 
+        BabelString for the remainder, and stores the overflow 
+        DrawBot.FormattedString as its cache, so it does not need to be
+        built again for the next TextBox.
         """
         self._fs = fs
     fs = property(_get_fs, _set_fs)
@@ -268,24 +988,53 @@ class BabelString:
         '<span class="top">Hello world</span>'
         """
         if self._html is None:
-            tags = []
-            self._html = ''
-            for run in self.runs:
-                if not run.s:
-                    continue
-                tag = None
-                if 'tag' in run.style:
-                    tag = run.style['tag']
-                else:
-                    tag = 'span'
-                self._html += '<' + tag
-                if 'name' in run.style:
-                    self._html += ' class="%s"' % run.style['name']
-                self._html += '>%s</%s>' % (run.s.strip(), tag)
-
-        return self._html
+            self._html = [self._getHtmlRun(s, style) for s, style in self._iterRuns()]
+        html = self._html
+        for index, fragment in enumerate(html):
+            if fragment is None: # New or changed run, (re)build the fragment.
+                html[index] = self._getHtmlRun(*self._getRun(index))
+        return ''.join(html)
     html = property(_get_html)
 
+    def iterHtml(self):
+        """Generate the HTML representation of self as fragments, one for 
+        each run, without joining them into a single string. Cached fragments
+        are used if they exist, but no cache is built. 
+
+        >>> bs = BabelString('Fish & Chips', dict(tag='h1'))
+        >>> bs.append('<cheap>', dict(tag='p'))
+        >>> list(bs.iterHtml())
+        ['<h1>Fish &amp; Chips</h1>', '<p>&lt;cheap&gt;</p>']
+        >>> import io
+        >>> f = io.StringIO()
+        >>> f.writelines(bs.iterHtml())
+        >>> f.getvalue() == bs.html
+        True
+        """
+        html = self._html
+        for index, (s, style) in enumerate(self._iterRuns()):
+            fragment = None
+            if html is not None:
+                fragment = html[index]
+            if fragment is None:
+                fragment = self._getHtmlRun(s, style)
+            yield fragment
+
+    def _getHtmlRun(self, s, style):
+        """Answer the html fragment of a single run, from its string `s`
+        and interned `style`. Empty runs are skipped.
+
+        >>> bs = BabelString()
+        >>> bs._getHtmlRun(' Hello ', internStyle(dict(tag='p', name='body')))
+        '<p class="body">Hello</p>'
+        >>> bs._getHtmlRun('', internStyle(dict(tag='p')))
+        ''
+        """
+        if not s:
+            return ''
+        openTag, closeTag = style.compiled('html', getHtmlTags)
+        return openTag + escape(s.strip(), quote=False) + closeTag
+
     def _get_css(self):
         """Property that creates a new Css instance of self,
         from the current set of runs, if the cached value self._html
@@ -299,11 +1048,75 @@ class BabelString:
         """
         if self._css is None:
             self._css = Css()
-            for run in self.runs:
-                self._css.append(run.style)
+            for s, style in self._iterRuns():
+                self._css.append(style)
         return self._css
     css = property(_get_css)
 
+class BabelStringBuilder:
+    """Collects (s, style) pairs, to build a BabelString in a single pass,
+    instead of appending them one by one. Runs with identical style are
+    merged while collecting, and the text is joined in blocks, so the 
+    collected data stays compact for large documents.
+    Optionally the builder starts with the runs of an existing BabelString.
+
+    >>> builder = BabelStringBuilder()
+    >>> for n in range(3):
+    ...     builder.append('Head%d' % n, dict(tag='h1'))
+    ...     builder.append('Text', dict(tag='p'))
+    ...     builder.append(' more text') # Style None, use the previous style.
+    >>> len(builder) # Number of runs
+    6
+    >>> bs = builder.build()
+    >>> bs, bs.runs[1].s
+    (<BabelString runs=6>, 'Text more text')
+    >>> builder = BabelStringBuilder(bs)
+    >>> builder.append('!')
+    >>> builder.build().runs[-1].s
+    'Text more text!'
+    """
+    # Number of text chunks that are joined into a single block.
+    BLOCK_SIZE = 1024
+
+    def __init__(self, bs=None):
+        self.blocks = [] # Joined blocks of text chunks.
+        self.chunks = [] # Text chunks that are not joined yet.
+        self.lengths = array('I') # Length of each run.
+        self.styles = [] # Interned style of each run.
+        if bs is not None:
+            for s, style in bs._iterRuns():
+                self.append(s, style)
+
+    def __len__(self):
+        return len(self.styles)
+
+    def append(self, s, style=None):
+        """Add `s` to the last run if the style is None or identical. 
+        Otherwise start a new run.
+        """
+        s = str(s)
+        style = internStyle(style)
+        if self.styles and (style is None or style is self.styles[-1]):
+            self.lengths[-1] += len(s)
+        else:
+            self.lengths.append(len(s))
+            self.styles.append(style or internStyle({}))
+        chunks = self.chunks
+        chunks.append(s)
+        if len(chunks) >= self.BLOCK_SIZE:
+            self.blocks.append(''.join(chunks))
+            chunks.clear()
+
+    def build(self, cls=None):
+        """Answer a new BabelString (or instance of `cls`) with the collected
+        runs.
+        """
+        bs = (cls or BabelString)()
+        if self.styles:
+            bs._setColumns(''.join(self.blocks) + ''.join(self.chunks), 
+                self.lengths, self.styles)
+        return bs
+
 if __name__ == "__main__":
     # Running this document will execute all >>> comments as test of this source.
     import doctest
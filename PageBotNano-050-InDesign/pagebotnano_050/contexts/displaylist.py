@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#   P A G E B O T  N A N O
+#
+#   Copyright (c) 2020+ Buro Petr van Blokland + Claudia Mens
+#   www.pagebot.io
+#   Licensed under MIT conditions
+#
+#   Supporting DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#   displaylist.py
+#
+#   The DisplayList records the drawing of a page as a list of operations,
+#   that can be replayed later in any context.
+#
+import sys
+sys.path.insert(0, "../..") # So we can import pagebotnano without installing.
+
+class DisplayList:
+    """Records the drawing calls of elements as a list of (operation,
+    arguments) tuples, with the absolute coordinates that the elements
+    calculated. Only the measuring calls (see MEASURING) are passed on to
+    the `context`. Other calls that are not recorded raise an AttributeError,
+    instead of drawing in the context outside the recording. The recorded 
+    list can be inspected, compared and replayed in any context that 
+    implements the drawing operations.
+
+    >>> displayList = DisplayList()
+    >>> displayList.newPage(595, 842)
+    >>> displayList.fill((1, 0, 0))
+    >>> displayList.rect(10, 20, 100, 200)
+    >>> displayList
+    <DisplayList ops=3>
+    >>> displayList.ops[-1]
+    ('rect', (10, 20, 100, 200))
+    >>> copy = DisplayList()
+    >>> displayList.replay(copy)
+    >>> copy.ops == displayList.ops
+    True
+    >>> displayList.textSize
+    Traceback (most recent call last):
+        ...
+    AttributeError: DisplayList has no context for "textSize"
+    >>> DisplayList(context=object()).polygon
+    Traceback (most recent call last):
+        ...
+    AttributeError: DisplayList does not record "polygon"
+    """
+    # Calls that don't draw, answered by the context while recording.
+    MEASURING = ('textSize', 'imageSize', 'textOverflow')
+
+    def __init__(self, context=None):
+        self.context = context # Context that answers the measurements.
+        self.ops = [] # List of (operation, arguments) tuples.
+
+    def __repr__(self):
+        return '<%s ops=%d>' % (self.__class__.__name__, len(self.ops))
+
+    def __len__(self):
+        return len(self.ops)
+
+    def __iter__(self):
+        return iter(self.ops)
+
+    def __getattr__(self, name):
+        # Only called for attributes that don't exist in self, such as the
+        # measuring methods of the context.
+        if name not in self.MEASURING:
+            raise AttributeError('%s does not record "%s"' % (self.__class__.__name__, name))
+        context = self.__dict__.get('context')
+        if context is None:
+            raise AttributeError('%s has no context for "%s"' % (self.__class__.__name__, name))
+        return getattr(context, name)
+
+    def newPage(self, w, h):
+        self.ops.append(('newPage', (w, h)))
+
+    def fill(self, c):
+        self.ops.append(('fill', (c,)))
+
+    def stroke(self, c, strokeWidth=None):
+        self.ops.append(('stroke', (c, strokeWidth)))
+
+    def strokeWidth(self, strokeWidth):
+        self.ops.append(('strokeWidth', (strokeWidth,)))
+
+    def rect(self, x, y, w, h):
+        self.ops.append(('rect', (x, y, w, h)))
+
+    def oval(self, x, y, w, h):
+        self.ops.append(('oval', (x, y, w, h)))
+
+    def line(self, p1, p2):
+        self.ops.append(('line', (p1, p2)))
+
+    def scale(self, sx, sy):
+        self.ops.append(('scale', (sx, sy)))
+
+    def image(self, path, p):
+        self.ops.append(('image', (path, p)))
+
+    def text(self, bs, p):
+        self.ops.append(('text', (bs, p)))
+
+    def textBox(self, bs, r):
+        """Record drawing the BabelString in rectangle `r`. Answer the
+        overflow, if the context can calculate it without drawing.
+        """
+        self.ops.append(('textBox', (bs, r)))
+        if self.context is not None and hasattr(self.context, 'textOverflow'):
+            return self.context.textOverflow(bs, r)
+        return None
+
+    def hyphenation(self, flag):
+        self.ops.append(('hyphenation', (flag,)))
+
+    def replay(self, context):
+        """Draw the recorded operations in `context`."""
+        for operation, args in self.ops:
+            getattr(context, operation)(*args)
+
+if __name__ == "__main__":
+    # Running this document will execute all >>> comments as test of this source.
+    import doctest
+    doctest.testmod()[0]
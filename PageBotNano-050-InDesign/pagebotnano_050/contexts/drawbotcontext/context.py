@@ -20,6 +20,27 @@ import drawBot
 from pagebotnano.babelstring import BabelString
 from pagebotnano.toolbox.color import color, Color
 
+def getUtf16Start(text, units):
+    """Answer the index in `text` where the tail of `units` UTF-16 code units
+    starts. The length of a DrawBot.FormattedString counts UTF-16 units, as
+    NSString does, so characters outside the Basic Multilingual Plane, such
+    as emoji, count as 2.
+
+    >>> getUtf16Start('Hello world', 5)
+    6
+    >>> getUtf16Start('Fish \U0001F41F chips', 8) # The fish counts 2 units
+    5
+    >>> getUtf16Start('Hello', 10)
+    0
+    """
+    if not text or max(text) <= '\uffff': # Only single unit characters.
+        return max(0, len(text) - units)
+    start = len(text)
+    while units > 0 and start > 0:
+        start -= 1
+        units -= 2 if text[start] > '\uffff' else 1
+    return start
+
 class DrawBotContext:
     
     def newDrawing(self):
@@ -28,6 +49,9 @@ class DrawBotContext:
     def saveImage(self, path, multipage=True):
         return drawBot.saveImage(path, multipage=multipage)
 
+    def newPage(self, w, h):
+        drawBot.newPage(w, h)
+
     def fill(self, c):
         """Set the fill mode of the context. `c` can be None, a number,
         a name or a Color instance. 
@@ -97,10 +121,22 @@ class DrawBotContext:
         drawBot.text(bs.fs, p)
 
     def textBox(self, bs, r):
-        # Set the cache from the overflow, we don't have the source anymore
-        overFlow = BabelString(hyphenation=bs.hyphenation) 
-        overFlow.fs = drawBot.textBox(bs.fs, r) 
-        return overFlow # Return this “incomplete” BabelString.
+        """Draw the BabelString in the rectangle `r`. Answer the overflow as
+        a view on `bs`, so it keeps the runs and styles of the remainder.
+        The overflow DrawBot.FormattedString is stored as cache of the view.
+        """
+        return self._getOverflow(bs, drawBot.textBox(bs.fs, r))
+
+    def textOverflow(self, bs, r):
+        """Answer the overflow of the BabelString in the rectangle `r`,
+        in the same way as self.textBox, but without drawing.
+        """
+        return self._getOverflow(bs, drawBot.textOverflow(bs.fs, r))
+
+    def _getOverflow(self, bs, overflowFs):
+        overflow = bs[getUtf16Start(bs.s, len(overflowFs)):]
+        overflow.fs = overflowFs
+        return overflow
 
     def textSize(self, bs, w=None, h=None):
         return drawBot.textSize(bs.fs, width=w, height=h)
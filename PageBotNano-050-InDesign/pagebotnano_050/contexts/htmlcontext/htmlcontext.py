@@ -54,12 +54,28 @@ class HtmlContext:
         self.pages = []
         self.css = []
         self.style = {}
-        self.newPage() # Set a current page to draw in.
+        self._addPage() # Set a current page to draw in.
+        self.pageCount = 0 # Number of self.newPage calls in this drawing.
 
-    def newPage(self):
-        self.page = page = dict(head='', body='')
+    def _addPage(self):
+        # The body is a list of html fragments, written one by one on saving.
+        self.page = page = dict(head='', body=[])
         self.pages.append(page)
 
+    def newPage(self, w=None, h=None):
+        """Start a new page. The first call after self.newDrawing uses
+        the page that was already created there.
+
+        >>> context = HtmlContext()
+        >>> context.newPage(595, 842)
+        >>> context.newPage(595, 842)
+        >>> len(context.pages)
+        2
+        """
+        if self.pageCount:
+            self._addPage()
+        self.pageCount += 1
+
     def stroke(self, stroke, strokeWidth=None):
         if strokeWidth is not None:
             self.style['strokeWidth'] = strokeWidth
@@ -69,10 +85,30 @@ class HtmlContext:
         self.style['fill'] = fill
 
     def rect(self, x, y, w, h):
-        self.page['body'] += '<div width="%d"></div>' % w
+        self.page['body'].append('<div width="%d"></div>' % w)
 
     def text(self, bs, p):
-        self.page['body'] += '<p>%s</p>' % bs.html
+        body = self.page['body']
+        body.append('<p>')
+        body.extend(bs.iterHtml())
+        body.append('</p>')
+
+    def writePage(self, f, page):
+        """Write the html of the page into the open file `f`, streaming the
+        fragments of the body, without joining them into a single string.
+
+        >>> import io
+        >>> context = HtmlContext()
+        >>> context.rect(0, 0, 100, 100)
+        >>> f = io.StringIO()
+        >>> context.writePage(f, context.page)
+        >>> '<body>\\n        <div width="100"></div>\\n    </body>' in f.getvalue()
+        True
+        """
+        head, tail = self.PAGE.split('%(body)s')
+        f.write(head % page)
+        f.writelines(page['body'])
+        f.write(tail)
 
     def saveImage(self, path, multipage=True):
         """Create folder names `path` if it does not already exist.
@@ -89,7 +125,7 @@ class HtmlContext:
             else:
                 fileName = 'page%03d' % pIndex
             f = codecs.open(path+fileName, mode="w", encoding="utf-8") # Save the XML as unicode.
-            f.write(self.PAGE % page)
+            self.writePage(f, page)
             f.close()
 
 
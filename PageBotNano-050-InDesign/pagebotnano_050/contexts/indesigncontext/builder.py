@@ -22,8 +22,47 @@ sys.path.insert(0, "../../..") # So we can import pagebotnano without installing
 
 from pagebotnano.contexts.indesigncontext.constants import JSX_LIB
 from pagebotnano.toolbox.color import noColor
+from pagebotnano.babelstring import internStyle
 from pagebotnano.constants import *
 
+def getInDesignStyle(style):
+    """Answer the list of JS property lines that define the paragraph
+    style in InDesign. Used by InDesignBuilder.outDocumentStyles through
+    the compiled-style cache, so each distinct style is translated once.
+
+    >>> getInDesignStyle(dict(font='Georgia', tag='p'))
+    []
+    """
+    lines = []
+    if 'font' in style:
+        font = style['font']
+        if not isinstance(font, str): # For now, only with real Font objects.
+            lines.append('\tappliedFont:"%s",' % font.info.familyName)
+            lines.append('\tfontStyle:"%s",' % font.info.styleName)
+    if 'fontSize' in style:
+        lines.append('\tpointSize:"%s",' % style['fontSize'])
+    if 'leading' in style:
+        leading = style['leading']
+        leading.base = style.get('fontSize', DEFAULT_FONT_SIZE)
+        lines.append('\tleading:"%s",' % pt(leading))
+    if 'textFill' in style:
+        fillColor = style['textFill']
+        if fillColor.isCmyk:
+            c, m, y, k = fillColor.cmyk
+            lines.append('\tfillColor: pbGetColor(pbDoc, [%s, %s, %s, %s]),' % (c*100, m*100, y*100, k**100))
+        else: # Round other colors to rgb output.
+            r, g, b = fillColor.rgb
+            lines.append('\tfillColor: pbGetColor(pbDoc, [%s, %s, %s]),' % (r*255, g*255, b*255))
+    if 'textStroke' in style:
+        strokeColor = style['textStroke']
+        if strokeColor.isCmyk:
+            c, m, y, k = strokeColor.cmyk
+            lines.append('\tstrokeColor: pbGetColor(pbDoc, [%s, %s, %s, %s]),' % (c*100, m*100, y*100, k**100))
+        else: # Round other colors to rgb output.
+            r, g, b = strokeColor.rgb
+            lines.append('\tstrokeColor: pbGetColor(pbDoc, [%s, %s, %s]),' % (r*255, g*255, b*255))
+    return lines
+
 class InDesignBuilder:
 
     PB_ID = 'inds'
@@ -112,34 +151,9 @@ class InDesignBuilder:
         self._out('/* Paragraph styles */')
         for name, style in doc.styles.items():
             self._out('pbDoc.paragraphStyles.add({name:"%s",' % name)
-            if 'font' in style:
-                font = style['font']
-                if not isinstance(font, str): # For now, only with real Font objects.
-                    self._out('\tappliedFont:"%s",' % font.info.familyName)
-                    self._out('\tfontStyle:"%s",' % font.info.styleName)
-            if 'fontSize' in style:
-                fontSize = pt(style['fontSize'])
-                self._out('\tpointSize:"%s",' % style['fontSize'])
-            if 'leading' in style:
-                leading = style['leading']
-                leading.base = style.get('fontSize', DEFAULT_FONT_SIZE)
-                self._out('\tleading:"%s",' % pt(leading))
-            if 'textFill' in style:
-                fillColor = style['textFill']
-                if fillColor.isCmyk:
-                    c, m, y, k = fillColor.cmyk
-                    self._out('\tfillColor: pbGetColor(pbDoc, [%s, %s, %s, %s]),' % (c*100, m*100, y*100, k**100))
-                else: # Round other colors to rgb output.
-                    r, g, b = fillColor.rgb
-                    self._out('\tfillColor: pbGetColor(pbDoc, [%s, %s, %s]),' % (r*255, g*255, b*255))
-            if 'textStroke' in style:
-                strokeColor = style['textStroke']
-                if fillColor.isCmyk:
-                    c, m, y, k = strokeColor.cmyk
-                    self._out('\tstrokeColor: pbGetColor(pbDoc, [%s, %s, %s, %s]),' % (c*100, m*100, y*100, k**100))
-                else: # Round other colors to rgb output.
-                    r, g, b = strokeColor.rgb
-                    self._out('\tstrokeColor: pbGetColor(pbDoc, [%s, %s, %s]),' % (r*255, g*255, b*255))
+            # Translation of the style is cached for each distinct style.
+            for line in internStyle(style).compiled('indesign', getInDesignStyle):
+                self._out(line)
             self._out('});')
 
     def _outSelectPage(self, e):
@@ -523,12 +523,11 @@ class SketchContext(BaseContext):
         >>> sas2 = context.fromBabelString(bs) # New conversion
         >>> #sas == sas2 # Bi-directional conversion works
         True
-        >>> # Now change the BabelString
-        >>> bs.runs[0].style['font'] = 'Verdana-Bold'
-        >>> bs.runs[1].style['font'] = 'Verdana-Italic'
-        >>> bs.runs[1].style['textFill'] = color(1, 0, 0)
-        >>> bs.runs[2].style['textFill'] = color(1, 0, 0.5)
-        >>> bs.runs[2].s = ' changed' # Change text of the run
+        >>> # Now change the BabelString. Runs are snapshots, so build a new one.
+        >>> r0, r1, r2 = bs.runs
+        >>> bs = bs.fromRuns([(r0.s, dict(r0.style, font='Verdana-Bold')),
+        ...     (r1.s, dict(r1.style, font='Verdana-Italic', textFill=color(1, 0, 0))),
+        ...     (' changed', dict(r2.style, textFill=color(1, 0, 0.5)))]) # Change text of the run
         >>> sas2 = context.fromBabelString(bs) # New conversion
         >>> skTextBox.attributedString = sas2
         >>> from pagebot.filepaths import getExportPath
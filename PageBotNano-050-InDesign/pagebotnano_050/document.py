@@ -23,6 +23,7 @@ from pagebotnano.constants import A4, EXPORT_DIR
 from pagebotnano.elements import Element, Page
 from pagebotnano.contexts.drawbotcontext.context import DrawBotContext
 from pagebotnano.toolbox import makePadding
+from pagebotnano.toolbox.elementindex import ElementIndex
 from pagebotnano.themes import BaseTheme, DefaultTheme
 from pagebotnano.templates.onecolumn import OneColumnTemplates
 
@@ -55,6 +56,10 @@ class Document:
         self.padding = pt, pr, pb, pl # Initialize the default padding
         # Storage for the pages in this document
         self.pages = [] # Simple list, the index is the page number (starting at 0)
+        # Index of the elements on all pages by name, class and page. 
+        self.index = ElementIndex()
+        # Set of the pages that changed since they were built, see Page.treeChanged()
+        self._dirtyPages = set()
 
         # The TemplateSet dictionary contains a set of functions that
         # compose the pages and containing elements for a particular
@@ -151,50 +156,131 @@ class Document:
         if page.h is None:
             page.h = self.h
         self.pages.append(page)
+        # Elements on the page are indexed, also the ones that are added later.
+        page.index = self.index
+        page.dirtyPages = self._dirtyPages
+        if page.dirty:
+            self._dirtyPages.add(page)
+        for e in page.elements:
+            self.index.addTree(e, page)
 
-    def compose(self):
+    def find(self, name, page=None):
+        """Answer the first element with `name` in the document, or on `page`
+        if it is defined. Answer None if it cannot be found.
+
+        >>> from pagebotnano.elements import Rect
+        >>> doc = Document()
+        >>> page = doc.newPage()
+        >>> e = Rect(name='mainText')
+        >>> page.addElement(e)
+        >>> doc.find('mainText') is e
+        True
+        """
+        return self.index.find(name, page)
+
+    def findAll(self, name=None, cls=None, pattern=None, prefix=None, page=None):
+        """Answer the list of elements in the document that match all 
+        defined arguments, using the index. See ElementIndex.findAll.
+
+        >>> from pagebotnano.elements import Rect, Text
+        >>> doc = Document()
+        >>> for pn in range(3):
+        ...     page = doc.newPage()
+        ...     page.addElement(Rect(name='mainText'))
+        ...     page.addElement(Text('Hello', 0, 0, name='pageNumber'))
+        >>> len(doc.findAll(name='mainText')), len(doc.findAll(cls=Text)), len(doc.findAll(prefix='page', page=page))
+        (3, 3, 1)
+        >>> page.removeElement(page.elements[0]) 
+        <Rect name=mainText w=None h=None>
+        >>> len(doc.findAll(pattern='Text'))
+        2
+        """
+        return self.index.findAll(name=name, cls=cls, pattern=pattern, 
+            prefix=prefix, page=page)
+
+    def compose(self, force=False):
         """Compose the document, by looking through the pages, and the recursively
         tell every page to compose itself (and its comtained elements).
+        Pages that already have been composed are skipped, as the templates
+        add their elements again, unless `force` is True.
 
         >>> doc = Document()
         >>> page = doc.newPage()
         >>> page = doc.newPage()
-        >>> page = doc.newPage()
         >>> doc.compose()
+        >>> page = doc.newPage()
+        >>> [page.composed for page in doc.pages]
+        [True, True, False]
+        >>> doc.compose() # Only composes the new page
         """
         for page in self.pages:
-            page.compose(doc=self, page=page) # Passing self as document, in case the page needs more info
+            if force or not page.composed:
+                page.compose(doc=self, page=page) # Passing self as document, in case the page needs more info
         self.hasComposed = True # Flag that we did this, in case called separate from self.export
 
-    def build(self):
+    def _get_dirtyPages(self):
+        """Answer the list of pages that changed since they were built,
+        including content that was altered in place. The pages add themselves
+        to the set when they change, so the elements are not searched.
+
+        >>> from pagebotnano.elements import Rect, Text
+        >>> doc = Document()
+        >>> for pn in range(3):
+        ...     page = doc.newPage()
+        ...     page.addElement(Rect(10, 10, 100, 100, name='r%d' % pn))
+        >>> len(doc.dirtyPages)
+        3
+        >>> doc.build()
+        >>> doc.dirtyPages
+        []
+        >>> doc.find('r1').w = 200
+        >>> doc.dirtyPages
+        [<Page pn=2 w=595 h=842 elements=1>]
+        >>> doc.build()
+        >>> doc.pages[2].addElement(Text('Hello', 10, 10))
+        >>> doc.build()
+        >>> doc.pages[2].elements[-1].bs.append(' world') # Altered in place
+        >>> doc.dirtyPages
+        [<Page pn=3 w=595 h=842 elements=2>]
+        """
+        if not self._dirtyPages:
+            return []
+        return [page for page in self.pages if page in self._dirtyPages]
+    dirtyPages = property(_get_dirtyPages)
+
+    def build(self, force=False):
         """Build the document by looping trough the pages, and then recursively
         tell every page to build itself (and its contained elements).
+        If the document was built before and no page changed since, then 
+        the drawing in the context is still valid, and nothing is done,
+        unless `force` is True.
         """
+        if not force and self.hasBuilt and not self._dirtyPages:
+            return # Nothing changed since the last build.
         # Clear all previous drawing in the context canvas.
         self.context.newDrawing()
 
         # Tell each page to build itself in context, including their child elements.
+        # Pages that did not change replay the display list of their last build.
         for page in self.pages:
-            page.build(doc=self) # Passing self as document, in case the page needs more info.
+            page.build(doc=self, force=force) # Passing self as document, in case the page needs more info.
         self.hasBuilt = True # Flag that we did this, in case called separate from self.export.
 
     def export(self, path, force=False, multipage=True):
         """Export the document into the _export folder. We assume that the 
         document and pages are built. We don't do that here, in case multiple
         formats are saved from the same build.
-        If `force` is True or if build has not been done yet, then call
-        self.build anyway.
+        Only pages that were not composed yet are composed. The document
+        is only built again if pages changed since the last build.
+        If `force` is True, then compose and build all pages anyway.
 
         >>> doc = Document()
         >>> doc.newPage()
         <Page pn=1 w=595 h=842 elements=0>
         >>> doc.export('_export/Document-export.pdf')
         """
-        if force or not self.hasComposed: # If forced or not done yet, compose the pages.
-            self.compose()
-
-        if force or not self.hasBuilt: # If forced or not done yet, build the pages.
-            self.build()
+        self.compose(force) # Compose the pages that are new, or all if forced.
+        self.build(force) # Build if pages changed, or if forced.
 
         if path.startswith(EXPORT_DIR) and not os.path.exists(EXPORT_DIR):
             os.mkdir(EXPORT_DIR)
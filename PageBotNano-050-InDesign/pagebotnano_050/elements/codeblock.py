@@ -31,6 +31,8 @@ class CodeBlock(Element):
     def __init__(self, code, x=None, y=None, w=None, h=None, name=None, 
         fill=None, stroke=None, strokeWidth=None, tryExcept=False,
         placeCode=False):
+        Element.__init__(self, x=x, y=y, w=w, h=h, name=name, 
+            fill=fill, stroke=stroke, strokeWidth=strokeWidth)
         assert isinstance(code, str)
         self.code = code
         self.tryExcept = tryExcept # Showing Python errors or not.
@@ -40,13 +42,20 @@ class CodeBlock(Element):
         return '<%s code=%s>' % (self.__class__.__name__, self.code.replace('\n',';')[:200] or 'None')
 
     def build(self, x, y, doc, page, parent=None):
-        """Run the code block. If the view.showSourceCode is True, then just export the code
-        for debugging."""
-        if not view.showSourceCode:
-            self.run()
-        else:
-            bs = BabelString(self.code, self.DEFAULT_CODE_STYLE)
-            Text.build(bs, view, origin, drawElements, **kwargs)
+        """Run the code block, with `doc` and `page` as globals. The code
+        block does not draw, so the page does not change by building it.
+
+        >>> from pagebotnano.document import Document
+        >>> doc = Document()
+        >>> page = doc.newPage()
+        >>> cb = CodeBlock('page.name = "Run"')
+        >>> page.addElement(cb)
+        >>> doc.build()
+        >>> page.name, cb.dirty, doc.dirtyPages
+        ('Run', False, [])
+        """
+        self.run(dict(doc=doc, page=page))
+        self.dirty = False # Built, until self.changed() is called.
 
     def run(self, targets=None, verbose=False):
         """Execute the code block. Answer a set of compiled methods, as found in the <code class="Python">...</code>,
@@ -83,45 +92,9 @@ class CodeBlock(Element):
         >>> sorted(result.keys()), g['aa'] # Result is added to the globals
         (['__code__', 'a', 'aa', 'doc', 'page'], 6000000)
         """
-
-
-
-
-        if targets is None:
-            if page is None:
-                page = self.doc[1]
-
-            targets = dict(composer=self, doc=self.doc, page=page, style=self.doc.styles,
-                newText=newText)
-
-            if page is not None:
-                targets['box'] = page.select('main')
-
-        elif page is not None:
-            targets['page'] = page
-
-        if 'errors' not in targets:
-            targets['errors'] = []
-        errors = targets['errors']
-
-        if 'verbose' not in targets:
-            targets['verbose'] = []
-        verbose = targets['verbose']
-
-        if galley is None:
-            galley = page.galley
-
         if targets is None:
-            # If no globals defined, create a new empty dictionary as storage of result
-            # and try to fill it in case we are part of a page, e.g. for debugging.
-            assert self.doc is not None
-            if not self.doc.pages:
-                page = self.doc.newPage()
-            page = self.doc.pages[-1] # Get the last page
-
-            targets = dict(pub=self, doc=self.doc, page=page)
-            if self.doc is not None:
-                targets['doc'] = doc
+            # If no globals defined, create a new empty dictionary as storage of result.
+            targets = {}
         if not self.tryExcept: # For debugging show full error of code block run.
             exec(self.code, targets) # Execute code block, where result goes dict.
             if '__builtins__' in targets:
@@ -19,10 +19,11 @@
 import sys
 sys.path.insert(0, "../..") # So we can import pagebotnano without installing.
 
-import drawBot
 from random import random
 
 from pagebotnano.elements import Element
+from pagebotnano.toolbox.spatialindex import SpatialIndex
+from pagebotnano.contexts.displaylist import DisplayList
 
 class Page(Element):
     # Class names start with a capital. See a class as a factory
@@ -30,8 +31,20 @@ class Page(Element):
     # Page being another kind of Element, means that theoretically
     # it can be placed on another page or inside another element.
     def __init__(self, pn=None, **kwargs):
+        # ElementIndex of the document, set when the page is added to it.
+        self.index = None 
+        # Set of the dirty pages of the document, set when the page is added to it.
+        self.dirtyPages = None
+        # SpatialIndex of the element boxes, created on first usage.
+        self._spatialIndex = None
         Element.__init__(self, **kwargs)
         self.pn = pn # Store the page number in the page.
+        # Composing runs the templates, that add elements, so it is done once.
+        self.composed = False 
+        # DisplayList of the last build and its (x, y) origin, replayed while 
+        # the page did not change.
+        self.displayList = None
+        self.displayOrigin = None
 
     def __repr__(self):
         # This method is called when print(page) is executed.
@@ -40,31 +53,256 @@ class Page(Element):
         return '<%s pn=%d w=%d h=%d elements=%d>' % (self.__class__.__name__, 
             self.pn, self.w, self.h, len(self.elements))
 
+    def treeChanged(self):
+        """Add self to the dirty pages of the document, see Element.changed().
+
+        >>> from pagebotnano.document import Document
+        >>> doc = Document()
+        >>> page = doc.newPage()
+        >>> doc.build()
+        >>> page in page.dirtyPages
+        False
+        >>> page.w = 300
+        >>> page in page.dirtyPages
+        True
+        """
+        if self.dirtyPages is not None:
+            self.dirtyPages.add(self)
+
     def compose(self, doc, page=None, parent=None):
         if page is None:
             page = self
         Element.compose(self, doc, page, parent)
+        self.composed = True
+
+    def _get_page(self):
+        """Answer self, as the page of the child elements."""
+        return self
+    page = property(_get_page)
 
     def addElement(self, e):
         """Add the element to the list of child elements.
         """
-        self.elements.append(e)
+        Element.addElement(self, e)
+
+    def indexTree(self, e):
+        """Add `e` and its child elements to the document index and the 
+        spatial index of self, if they exist.
+        """
+        if self.index is not None:
+            self.index.addTree(e, self)
+        if self._spatialIndex is not None:
+            self.updateSpatialIndex(e)
+
+    def unindexTree(self, e):
+        """Remove `e` and its child elements from the document index and the
+        spatial index of self, if they exist.
+        """
+        if self.index is not None:
+            self.index.removeTree(e)
+        if self._spatialIndex is not None:
+            for child in [e] + e.findAll():
+                self._spatialIndex.remove(child)
+
+    def _get_spatialIndex(self):
+        """Answer the SpatialIndex of the absolute boxes of all elements on 
+        the page. It is created on first usage, then it is updated when 
+        elements are added, removed, moved or resized.
+
+        >>> from pagebotnano.elements import Rect
+        >>> page = Page(w=500, h=500)
+        >>> e = Rect(100, 100, 200, 200)
+        >>> page.addElement(e)
+        >>> child = e.addElement(Rect(10, 10, 20, 20))
+        >>> page.spatialIndex
+        <SpatialIndex elements=2 cells=16>
+        >>> e.x = 300 # Moving e also moves the box of its child.
+        >>> page.spatialIndex.getBox(child)
+        (310, 110, 330, 130)
+        """
+        if self._spatialIndex is None:
+            self._spatialIndex = SpatialIndex()
+            for e in self._elements:
+                self.updateSpatialIndex(e)
+        return self._spatialIndex
+    spatialIndex = property(_get_spatialIndex)
+
+    def updateSpatialIndex(self, e):
+        """Update the absolute boxes of `e` and its child elements in 
+        self.spatialIndex.
+        """
+        spatialIndex = self.spatialIndex
+        spatialIndex.update(e, e.getAbsoluteBox())
+        for child in e._elements:
+            self.updateSpatialIndex(child)
+
+    def findInRect(self, x, y, w, h):
+        """Answer the list of elements on the page, at any depth, with a 
+        bounding box that overlaps the rectangle (x, y, w, h) in page 
+        coordinates. 
+
+        >>> from pagebotnano.elements import Rect
+        >>> page = Page(w=500, h=500)
+        >>> for n in range(10):
+        ...     e = Rect(n*50, 0, 40, 40, name='r%d' % n)
+        ...     page.addElement(e)
+        >>> [e.name for e in page.findInRect(85, 0, 100, 10)]
+        ['r1', 'r2', 'r3']
+        >>> e = page.elements[2]
+        >>> [c.name for c in page.findInRect(*e.getAbsoluteBox()[:2], e.w, e.h) if c is not e] # Collisions
+        []
+        """
+        return self.spatialIndex.findInRect(x, y, w, h)
+
+    def findAtPoint(self, x, y):
+        """Answer the list of elements on the page that contain the point
+        (x, y), in page coordinates.
+
+        >>> from pagebotnano.elements import Rect
+        >>> page = Page(w=500, h=500)
+        >>> e = Rect(100, 100, 200, 200)
+        >>> page.addElement(e)
+        >>> child = e.addElement(Rect(10, 10, 20, 20))
+        >>> page.findAtPoint(115, 115), page.findAtPoint(50, 50)
+        ([<Rect name=Rect w=200 h=200>, <Rect name=Rect w=20 h=20>], [])
+        """
+        return self.spatialIndex.findAtPoint(x, y)
+
+    def findNearest(self, x, y, count=1):
+        """Answer the list of `count` elements on the page nearest to the 
+        point (x, y), in page coordinates, nearest first.
+
+        >>> from pagebotnano.elements import Rect
+        >>> page = Page(w=500, h=500)
+        >>> for n in range(10):
+        ...     e = Rect(n*50, 0, 40, 40, name='r%d' % n)
+        ...     page.addElement(e)
+        >>> [e.name for e in page.findNearest(190, 100, 2)]
+        ['r3', 'r4']
+        """
+        return self.spatialIndex.findNearest(x, y, count)
+
+    def find(self, name=None, pattern=None):
+        """Answer the element with `name` or `pattern` on this page. If 
+        the page is in a document, then use its index instead of searching
+        through the elements.
+
+        >>> from pagebotnano.document import Document
+        >>> from pagebotnano.elements import Rect
+        >>> doc = Document()
+        >>> page = doc.newPage()
+        >>> page.addElement(Rect(name='mainText'))
+        >>> page.find('mainText'), page.find(pattern='Tex'), page.find('other')
+        (<Rect name=mainText w=None h=None>, <Rect name=mainText w=None h=None>, None)
+        """
+        if self.index is None:
+            return Element.find(self, name, pattern)
+        assert name is not None or pattern is not None, ('%s.find: Define either name or pattern' % self.__class__.__name__)
+        if (name is not None and name == self.name) or (pattern is not None and pattern in self.name):
+            return self
+        found = None
+        if name is not None:
+            found = self.index.find(name, self)
+        if found is None and pattern is not None:
+            found = (self.index.findAll(pattern=pattern, page=self) or [None])[0]
+        return found
+
+    def findAll(self, name=None, cls=None, pattern=None):
+        """Answer the list of elements on this page that match the defined
+        arguments, see Element.findAll. If the page is in a document, then
+        use its index.
+
+        >>> from pagebotnano.document import Document
+        >>> from pagebotnano.elements import Rect
+        >>> doc = Document()
+        >>> page = doc.newPage()
+        >>> page.addElement(Rect(name='mainText'))
+        >>> e = page.elements[0].addElement(Element(name='subText'))
+        >>> page.findAll(pattern='Text') == Element.findAll(page, pattern='Text')
+        True
+        """
+        if self.index is None:
+            return Element.findAll(self, name, cls, pattern)
+        return self.index.findAll(name=name, cls=cls, pattern=pattern, page=self)
+
+    def record(self, x=0, y=0, doc=None):
+        """Answer a DisplayList with the drawing of the page and its elements,
+        in absolute coordinates. The elements build as usual, while the
+        doc.context is replaced by the recording list.
+
+        >>> from pagebotnano.document import Document
+        >>> from pagebotnano.elements import Rect
+        >>> doc = Document()
+        >>> page = doc.newPage()
+        >>> page.addElement(Rect(10, 20, 100, 200, fill=0.5))
+        >>> displayList = page.record(doc=doc)
+        >>> [operation for operation, _ in displayList]
+        ['newPage', 'stroke', 'fill', 'rect']
+        >>> displayList.ops[-1], doc.context is displayList
+        (('rect', (10, 20, 100, 200)), False)
+        """
+        assert doc is not None, ('%s.record: Document needs to be defined.' % self.__class__.__name__)
+        displayList = DisplayList(doc.context)
+        context = doc.context
+        doc.context = displayList # Elements draw in the list, instead of the context.
+        try:
+            displayList.newPage(self.w, self.h)
+            for element in self._elements:
+                # Passing on doc and this page in case an element needs more info.
+                # Since this bottom-left corner of the page is the origin for position,
+                # set it to default (0, 0).
+                # In case a page is used on a spread or for display on another page,
+                # (x, y) can have another value.
+                element.build(x=x, y=y, doc=doc, page=self, parent=self) 
+        finally:
+            doc.context = context
+        return displayList
 
-    def build(self, x=0, y=0, doc=None, **kwargs):
+    def build(self, x=0, y=0, doc=None, force=False, **kwargs):
         """Draw the page and recursively make the child elements to draw 
-        themselves in DrawBot. The build is “broadcast” to all the elements 
-        on the page.
+        themselves in the context. The build is “broadcast” to all the elements 
+        on the page, recording their drawing in self.displayList, that is
+        then replayed in doc.context. If the page did not change since the 
+        last build, then the recorded display list is replayed, without
+        building the elements again, unless `force` is True. Content that
+        was altered in place also counts as a change, see Text.bs, so the 
+        BabelStrings that the display list refers to are never replayed
+        with content that differs from the recording.
 
+        >>> from pagebotnano.document import Document
+        >>> from pagebotnano.elements import Rect, Text
+        >>> doc = Document()
+        >>> page = doc.newPage()
+        >>> page.addElement(Rect(10, 20, 100, 200, fill=0.5, name='r'))
+        >>> page.build(doc=doc)
+        >>> displayList = page.displayList
+        >>> page.build(doc=doc) # Not changed, replays the same list.
+        >>> page.displayList is displayList
+        True
+        >>> page.find('r').x = 50
+        >>> page.build(doc=doc)
+        >>> page.displayList is displayList, page.displayList.ops[-1]
+        (False, ('rect', (50, 20, 100, 200)))
+        >>> text = Text('Hello', 10, 10)
+        >>> page.addElement(text)
+        >>> doc.build()
+        >>> displayList = page.displayList
+        >>> text.bs.append(' world') # Altered in place, records the page again.
+        >>> doc.build()
+        >>> page.displayList is displayList
+        False
+        >>> [args[0].s for operation, args in page.displayList if operation == 'text']
+        ['Hello world']
         """
         assert doc is not None, ('%s.build: Document needs to be defined.' % self.__class__.__name__)
-        drawBot.newPage(self.w, self.h) # Create a new DrawBot page.
-        for element in self.elements:
-            # Passing on doc and this page in case an element needs more info.
-            # Since this bottom-left corner of the page is the origin for position,
-            # set it to default (0, 0).
-            # In case a page is used on a spread or for display on another page,
-            # (x, y) can have another value.
-            element.build(x=x, y=y, doc=doc, page=self, parent=self) 
+        if (force or self.dirty or self.displayList is None 
+                or self.displayOrigin != (x, y)):
+            self.displayList = self.record(x, y, doc)
+            self.displayOrigin = x, y
+        self.displayList.replay(doc.context)
+        self.dirty = False # Built, until an element on the page changed.
+        if self.dirtyPages is not None:
+            self.dirtyPages.discard(self)
 
     # Rough example of implementing HTML/CSS generator in this architecture
     #def build_html(self):
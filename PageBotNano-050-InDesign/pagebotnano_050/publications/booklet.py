@@ -153,8 +153,9 @@ class Booklet(Publication):
                     # as many pages as needed to fill all the text in self.content.
                     # Otherwise break the loop, as we are done placing content.
                     bs = e.getOverflow(bs, doc=self.doc)
-                    # Test on this “incomplete” BabelString, as it only has a cached FS
-                    if not bs.fs:
+                    # The overflow is a view on the galley BabelString.
+                    # If it is empty, then all text is placed.
+                    if not bs:
                         break
 
             elif isinstance(ge, Image): # Images not supported yet
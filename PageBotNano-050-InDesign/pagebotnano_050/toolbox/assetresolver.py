@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#   P A G E B O T  N A N O
+#
+#   Copyright (c) 2020+ Buro Petr van Blokland + Claudia Mens
+#   www.pagebot.io
+#   Licensed under MIT conditions
+#
+#   Supporting DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#   assetresolver.py
+#
+#   The AssetResolver answers the existing paths of image references,
+#   scanning each folder once, instead of testing each path separately.
+#
+import os
+
+class AssetResolver:
+    """Resolves asset paths, such as the src of <img> tags. The file names
+    of each folder are scanned once and cached with the modification time
+    of the folder, so resolving many images in the same folder costs a
+    single directory scan. Paths that do not exist relative to the current
+    folder are searched in the optional `searchPaths`. References that
+    cannot be resolved are collected in self.missing, to be reported
+    together. The Typesetter calls self.refresh() for each typeset run, so 
+    files that were added or removed since are found.
+
+    >>> assets = AssetResolver(['../../../resources'])
+    >>> assets.resolve('../../../resources/images/cookbot1.jpg')
+    '../../../resources/images/cookbot1.jpg'
+    >>> assets.resolve('images/cookbot2.jpg') # Found in the search path
+    '../../../resources/images/cookbot2.jpg'
+    >>> assets.resolve('images/noImage.jpg') is None
+    True
+    >>> assets.resolveAll(['images/cookbot1.jpg', 'images/noImage.jpg', 'noFolder/x.png'])
+    {'images/cookbot1.jpg': '../../../resources/images/cookbot1.jpg', 'images/noImage.jpg': None, 'noFolder/x.png': None}
+    >>> assets.missing
+    ['images/noImage.jpg', 'noFolder/x.png']
+    >>> assets.scans # Number of folders that were scanned
+    4
+    """
+    def __init__(self, searchPaths=None):
+        self.searchPaths = list(searchPaths or [])
+        self.folders = {} # Folder path --> (mtime, file names, lower case file names) or None
+        self.paths = {} # Resolved path cache: reference --> path or None
+        self.missing = [] # Unresolved references, in order of usage.
+        self.scans = 0 # Number of directory scans, for profiling.
+
+    def __repr__(self):
+        return '<%s folders=%d paths=%d missing=%d>' % (self.__class__.__name__,
+            len(self.folders), len(self.paths), len(self.missing))
+
+    def refresh(self):
+        """Check the modification time of the scanned folders and forget the
+        ones that changed, with the paths that were resolved. Call this
+        before a new batch, if files may have been added or removed.
+
+        >>> import tempfile
+        >>> folder = tempfile.mkdtemp()
+        >>> path = os.path.join(folder, 'a.png')
+        >>> assets = AssetResolver()
+        >>> assets.resolve(path) is None
+        True
+        >>> open(path, 'wb').close()
+        >>> assets.resolve(path) is None # Still cached
+        True
+        >>> assets.refresh()
+        >>> assets.resolve(path) == path
+        True
+        """
+        for folder, entry in list(self.folders.items()):
+            try:
+                mtime = os.stat(folder or '.').st_mtime
+            except OSError:
+                mtime = None
+            if entry is None or entry[0] != mtime:
+                del self.folders[folder]
+                self.paths = {}
+        self.missing = []
+
+    def _getFolder(self, folder):
+        """Answer the (mtime, fileNames, lowerFileNames) of `folder`, 
+        scanning it on first usage. Answer None if the folder does not exist.
+        """
+        if folder not in self.folders:
+            self.scans += 1
+            try:
+                mtime = os.stat(folder or '.').st_mtime
+                with os.scandir(folder or '.') as entries:
+                    fileNames = set(entry.name for entry in entries)
+                self.folders[folder] = (mtime, fileNames, 
+                    set(fileName.lower() for fileName in fileNames))
+            except OSError:
+                self.folders[folder] = None
+        return self.folders[folder]
+
+    def getFileNames(self, folder):
+        """Answer the set of file names in `folder`, scanning it on first usage.
+        Answer None if the folder does not exist.
+        """
+        entry = self._getFolder(folder)
+        if entry is None:
+            return None
+        return entry[1]
+
+    def exists(self, path):
+        """Answer the boolean flag if the file `path` exists, using the
+        cached scan of its folder. If the name only matches in another case,
+        then the file system decides, as it can be case-insensitive (macOS).
+
+        >>> assets = AssetResolver()
+        >>> assets.exists('../../../resources/images/cookbot1.jpg')
+        True
+        >>> path = '../../../resources/images/COOKBOT1.JPG'
+        >>> assets.exists(path) == os.path.exists(path)
+        True
+        >>> assets.exists('../../../resources/images/noImage.jpg')
+        False
+        """
+        folder, fileName = os.path.split(path)
+        entry = self._getFolder(folder)
+        if entry is None:
+            return False
+        if fileName in entry[1]:
+            return True
+        return fileName.lower() in entry[2] and os.path.exists(path)
+
+    def resolve(self, path):
+        """Answer the existing path of the reference `path`, trying the
+        search paths if it does not exist as such. Answer None and add the
+        reference to self.missing if it cannot be found.
+        """
+        if path not in self.paths:
+            resolved = None
+            if path:
+                candidates = [path]
+                if not os.path.isabs(path):
+                    candidates += [os.path.join(searchPath, path) for searchPath in self.searchPaths]
+                for candidate in candidates:
+                    if self.exists(candidate):
+                        resolved = candidate
+                        break
+            self.paths[path] = resolved
+        resolved = self.paths[path]
+        if resolved is None and path not in self.missing:
+            self.missing.append(path)
+        return resolved
+
+    def resolveAll(self, paths):
+        """Resolve the iterable of references `paths` as one batch. Answer
+        the dictionary of reference --> resolved path or None.
+        """
+        return {path: self.resolve(path) for path in paths}
+
+if __name__ == "__main__":
+    # Running this document will execute all >>> comments as test of this source.
+    import doctest
+    doctest.testmod()[0]
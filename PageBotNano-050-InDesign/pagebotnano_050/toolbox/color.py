@@ -1180,6 +1180,27 @@ class NoColor(Color):
             return True
         return False
 
+class UndefinedColor(Color):
+    """Color of elements without fill or stroke. A single instance is 
+    shared by all of them, so it cannot be altered. Assign a new color to 
+    the element instead.
+
+    >>> undefinedColor.r = 1
+    Traceback (most recent call last):
+        ...
+    AttributeError: UndefinedColor cannot be altered, assign a new color instead
+    >>> undefinedColor.rgb
+    (None, None, None)
+    """
+    def __init__(self):
+        Color.__init__(self)
+        self.__dict__['frozen'] = True
+
+    def __setattr__(self, name, value):
+        if self.__dict__.get('frozen'):
+            raise AttributeError('%s cannot be altered, assign a new color instead' % self.__class__.__name__)
+        Color.__setattr__(self, name, value)
+
 def color(r=None, g=None, b=None, a=1, rgb=None, c=None, m=None, y=None,
         k=None, cmyk=None, spot=None, ral=None, name=None, tint=None):
     if isinstance(r, Color):
@@ -1195,6 +1216,9 @@ def color(r=None, g=None, b=None, a=1, rgb=None, c=None, m=None, y=None,
 #noColor = color(r=None, g=None, b=None, a=None)
 noColor = NoColor()
 
+# Undefined color, shared by all elements without fill or stroke. 
+undefinedColor = UndefinedColor()
+
 # Completely transparent, ignore setting the color. Draw color as previously.
 inheritColor = color(a=-1)
 blackColor = color(0)
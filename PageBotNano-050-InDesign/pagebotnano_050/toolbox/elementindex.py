@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#   P A G E B O T  N A N O
+#
+#   Copyright (c) 2020+ Buro Petr van Blokland + Claudia Mens
+#   www.pagebot.io
+#   Licensed under MIT conditions
+#
+#   Supporting DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#   elementindex.py
+#
+#   The ElementIndex of a Document keeps the elements of all pages by name,
+#   class and page, so they can be found without searching the element trees.
+#
+class ElementIndex:
+    """Index of the elements on the pages of a document. Elements are kept
+    by name, by class, by page and by (page, name). The index is updated by
+    Page.addElement, Element.addElement and Element.removeElement, for all
+    pages that are added to the Document. The names are also kept in a
+    trie of their suffixes, so elements can be found by name pattern or
+    prefix, without testing all names. A name of n characters adds up to
+    n * (n + 1) / 2 trie nodes, which is fine for the short names of
+    elements, but long names (e.g. made from text) take quadratic memory.
+    All lookups answer the elements in the order they were added.
+
+    >>> from pagebotnano.elements import Element, Rect, Text
+    >>> index = ElementIndex()
+    >>> page1, page2 = Element(name='page1'), Element(name='page2')
+    >>> index.addTree(Rect(name='mainText'), page1)
+    >>> index.addTree(Text('Hello', 0, 0, name='mainTitle'), page1)
+    >>> index.addTree(Rect(name='mainText'), page2)
+    >>> len(index), len(index.findAll(name='mainText')), len(index.findAll(pattern='ain'))
+    (3, 2, 3)
+    >>> index.findAll(prefix='main', cls=Text)
+    [<Text name=mainTitle w=None h=None>]
+    >>> index.find('mainText', page2) is index.findAll(page=page2)[0]
+    True
+    """
+    def __init__(self):
+        self.entries = {} # Element --> (sequence number, page, indexed name)
+        self.names = {} # Name --> dict of elements, used as ordered set.
+        self.classes = {} # Class --> dict of elements
+        self.pages = {} # Page --> dict of elements
+        self.pageNames = {} # (page, name) --> dict of elements
+        # Suffix trie of the names: each node is a dict char --> node,
+        # the None key holds the names that have a suffix through that node.
+        self.trie = {}
+        self.sequence = 0
+
+    def __repr__(self):
+        return '<%s elements=%d names=%d>' % (self.__class__.__name__,
+            len(self.entries), len(self.names))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, e):
+        return e in self.entries
+
+    def _addName(self, name):
+        for start in range(len(name)):
+            node = self.trie
+            for c in name[start:]:
+                node = node.setdefault(c, {})
+                node.setdefault(None, {})[name] = None
+
+    def _removeName(self, name):
+        # Names in a node also are in all its parent nodes, so the nodes
+        # without names left are removed with their child nodes.
+        for start in range(len(name)):
+            node = self.trie
+            for c in name[start:]:
+                child = node.get(c)
+                if child is None:
+                    break
+                names = child[None]
+                names.pop(name, None)
+                if not names:
+                    del node[c]
+                    break
+                node = child
+
+    def getNames(self, pattern='', prefix=''):
+        """Answer the list of indexed names that contain `pattern` and
+        start with `prefix`.
+
+        >>> from pagebotnano.elements import Element
+        >>> index = ElementIndex()
+        >>> page = Element()
+        >>> for name in ('mainText', 'subText', 'mainImage'):
+        ...     index.add(Element(name=name), page)
+        >>> index.getNames('Text'), index.getNames(prefix='main'), index.getNames('ai', 'sub')
+        (['mainText', 'subText'], ['mainText', 'mainImage'], [])
+        """
+        key = pattern or prefix
+        if not key:
+            return list(self.names)
+        node = self.trie
+        for c in key:
+            node = node.get(c)
+            if node is None:
+                return []
+        return [name for name in node.get(None, ()) if name.startswith(prefix)
+            and pattern in name]
+
+    def add(self, e, page):
+        """Add the element `e` on `page` to the index. If it was already
+        indexed, then it is moved to `page`.
+        """
+        if e in self.entries:
+            self.remove(e)
+        self.sequence += 1
+        self.entries[e] = self.sequence, page, e.name
+        self._addToNames(e, page, e.name)
+        self.classes.setdefault(e.__class__, {})[e] = None
+        self.pages.setdefault(page, {})[e] = None
+
+    def _addToNames(self, e, page, name):
+        if name not in self.names:
+            self.names[name] = {}
+            self._addName(name)
+        self.names[name][e] = None
+        self.pageNames.setdefault((page, name), {})[e] = None
+
+    def _removeFromNames(self, e, page, name):
+        for table, key in ((self.names, name), (self.pageNames, (page, name))):
+            elements = table[key]
+            del elements[e]
+            if not elements:
+                del table[key]
+                if table is self.names:
+                    self._removeName(name)
+
+    def addTree(self, e, page):
+        """Add the element `e` and its child elements on `page` to the index."""
+        self.add(e, page)
+        for child in e.findAll():
+            self.add(child, page)
+
+    def remove(self, e):
+        """Remove the element `e` from the index, if it is indexed."""
+        entry = self.entries.pop(e, None)
+        if entry is None:
+            return
+        _, page, name = entry # Name as indexed, e.name may have changed.
+        self._removeFromNames(e, page, name)
+        for table, key in ((self.classes, e.__class__), (self.pages, page)):
+            elements = table[key]
+            del elements[e]
+            if not elements:
+                del table[key]
+
+    def rename(self, e):
+        """Update the index for the changed name of element `e`, if it is
+        indexed. This is called by setting Element.name.
+
+        >>> from pagebotnano.elements import Element
+        >>> index = ElementIndex()
+        >>> page = Element()
+        >>> e = Element(name='mainText')
+        >>> index.add(e, page)
+        >>> e._name = 'subText' # Not calling the name property
+        >>> index.find('subText'), index.getNames('Text')
+        (None, ['mainText'])
+        >>> index.rename(e)
+        >>> index.find('mainText'), index.find('subText', page) is e, index.getNames('Text')
+        (None, True, ['subText'])
+        >>> index.remove(e)
+        >>> len(index), index.names, index.trie
+        (0, {}, {})
+        """
+        entry = self.entries.get(e)
+        if entry is None or entry[2] == e.name:
+            return
+        sequence, page, name = entry
+        self._removeFromNames(e, page, name)
+        self.entries[e] = sequence, page, e.name
+        self._addToNames(e, page, e.name)
+
+    def removeTree(self, e):
+        """Remove the element `e` and its child elements from the index."""
+        self.remove(e)
+        for child in e.findAll():
+            self.remove(child)
+
+    def find(self, name, page=None):
+        """Answer the first added element with `name`, on `page` if it is
+        defined. Answer None if it does not exist.
+        """
+        if page is None:
+            elements = self.names.get(name)
+        else:
+            elements = self.pageNames.get((page, name))
+        if not elements:
+            return None
+        return next(iter(elements))
+
+    def findAll(self, name=None, cls=None, pattern=None, prefix=None, page=None):
+        """Answer the list of elements that match all defined arguments:
+        the exact `name`, an instance of `cls`, `pattern` in the name, the
+        name starting with `prefix` and being on `page`.
+        """
+        if name is not None:
+            if page is not None:
+                candidates = [self.pageNames.get((page, name), ())]
+            else:
+                candidates = [self.names.get(name, ())]
+        elif pattern is not None or prefix is not None:
+            candidates = [self.names[n] for n in self.getNames(pattern or '', prefix or '')]
+        elif page is not None:
+            candidates = [self.pages.get(page, ())]
+        elif cls is not None:
+            candidates = [elements for c, elements in self.classes.items() if issubclass(c, cls)]
+        else:
+            candidates = [self.entries]
+        if page is not None and name is None: # Test the elements of the page, if less.
+            elements = self.pages.get(page, ())
+            if len(elements) < sum(len(c) for c in candidates):
+                candidates = [elements]
+        found = []
+        for elements in candidates:
+            for e in elements:
+                if name is not None and e.name != name:
+                    continue
+                if pattern is not None and pattern not in e.name:
+                    continue
+                if prefix is not None and not e.name.startswith(prefix):
+                    continue
+                if cls is not None and not isinstance(e, cls):
+                    continue
+                if page is not None and self.entries[e][1] is not page:
+                    continue
+                found.append(e)
+        if len(candidates) > 1: # Elements of multiple names or classes.
+            found.sort(key=lambda e: self.entries[e][0])
+        return found
+
+if __name__ == "__main__":
+    # Running this document will execute all >>> comments as test of this source.
+    import doctest
+    doctest.testmod()[0]
@@ -13,24 +13,580 @@
 #
 #   markdown.py
 #
+import os
 import re
-import codecs
+import mmap
+import hashlib
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from html import escape, unescape
+from xml.etree.ElementTree import Element, fromstring, ParseError
 
-def parseMarkdownFile(path):
-    """Regular expression based markdown parser.
+# Minimum number of lines of the chapters of a file, parsed in parallel.
+CHAPTER_LINES = 1000
+
+def parseMarkdownFile(path, workers=1):
+    """Read the markdown file and answer it parsed into an XML string.
+    The file is read line by line from a memory map, see iterMarkdownLines(),
+    so only the resulting XML is kept in memory. If `workers` is more than 1, 
+    then the file is split into chapters of at least CHAPTER_LINES lines, 
+    parsed in a pool of processes while the file is read, see iterOrdered().
 
     >>> path = '../../../resources/test.md'
     >>> xml = parseMarkdownFile(path)
     >>> '<python>' in xml and '</python>' in xml
     True
+    >>> parseMarkdownFile(path, workers=2) == xml
+    True
+    """
+    if workers > 1:
+        chapters = splitMarkdownChapters(iterMarkdownLines(path), CHAPTER_LINES)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            fragments = iterOrdered(executor, parseMarkdownFragment, chapters, workers * 2)
+            return '<xml>%s</xml>' % ''.join(fragments)
+    return ''.join(iterMarkdown(iterMarkdownLines(path)))
+
+def iterOrdered(executor, function, items, maxPending):
+    """Generate the results of `function` for each of the `items`, in the 
+    order of the items. The items are submitted to the `executor` while they
+    are generated, with at most `maxPending` of them waiting for a result, so
+    the items and results are never in memory all at once.
+
+    >>> from concurrent.futures import ThreadPoolExecutor
+    >>> with ThreadPoolExecutor(max_workers=2) as executor:
+    ...     list(iterOrdered(executor, len, iter(['a', 'bb', '', 'cccc']), 2))
+    [1, 2, 0, 4]
+    """
+    pending = deque()
+    for item in items:
+        if len(pending) >= maxPending:
+            yield pending.popleft().result()
+        pending.append(executor.submit(function, item))
+    while pending:
+        yield pending.popleft().result()
+
+# Line endings of the source, "\r\n" is one line ending.
+LINE_END = re.compile(b'\\r\\n?|\\n')
+
+def iterMarkdownLines(path):
+    """Generate the lines of the utf-8 file `path`, read from a memory map,
+    so the file is never in memory as a whole. The "\\r\\n" and "\\r" line
+    endings are normalized to "\\n", line by line.
+
+    >>> import os, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'test.md')
+    >>> with open(path, 'wb') as f:
+    ...     _ = f.write('# Hé\\r\\nOne\\rTwo\\n\\nThree'.encode('utf-8'))
+    >>> list(iterMarkdownLines(path))
+    ['# Hé\\n', 'One\\n', 'Two\\n', '\\n', 'Three']
+    >>> with open(path, 'wb') as f: # Only "\\r" line endings
+    ...     _ = f.write(b'a\\rb\\r\\rc\\r')
+    >>> list(iterMarkdownLines(path))
+    ['a\\n', 'b\\n', '\\n', 'c\\n']
+    """
+    with open(path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            return # Empty files cannot be mapped.
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = 0
+            size = len(mm)
+            while start < size:
+                # Newlines never occur inside utf-8 characters.
+                match = LINE_END.search(mm, start)
+                if match is None:
+                    yield mm[start:].decode('utf-8')
+                    break
+                yield mm[start:match.start()].decode('utf-8') + '\n'
+                start = match.end()
+
+def countMarkdownLines(path):
+    """Answer the number of lines of the file `path`, without reading it in 
+    memory as a whole.
+
+    >>> countMarkdownLines('../../../resources/test.md') == len(list(iterMarkdownLines('../../../resources/test.md')))
+    True
+    """
+    count = 0
+    for count, _ in enumerate(iterMarkdownLines(path), 1):
+        pass
+    return count
+
+# Patterns of the markdown block lines.
+HEAD = re.compile('(#{1,6}) ([^#].*)$') # # Head --> <h1>Head</h1>
+UL_ITEM = re.compile('[*-] (.*)$') # * Item --> <ul><li>Item</li></ul>
+OL_ITEM = re.compile('[0-9]+\\. (.*)$') # 1. Item --> <ol><li>Item</li></ol>
+QUOTE = re.compile('>+ ?(.*)$') # > Quote --> <blockquote>Quote</blockquote>
+HR = re.compile('---') # --- --> <hr/>
+FENCE = re.compile('~~~') # ~~~ ... ~~~ --> <python>...</python>
+# Tags of elements that are written as <tag/>
+EMPTY_TAGS = ('img', 'hr', 'br')
+IMAGE_LINE = re.compile('!\\[([^\\[\\]]+)\\]\\(([^\\)]+)\\)$') # Line with only an image.
+# Attributes of inline tags: name="value"
+ATTRIBUTE = re.compile('([A-Za-z_][\\w:.-]*)="([^"<]*)"')
+ATTRIBUTES = '(?:\\s+[A-Za-z_][\\w:.-]*="[^"<]*")*\\s*'
+# One alternation for all inline markdown, so each line is scanned once.
+INLINE = re.compile(
+    '(?P<empty><(?P<emptyTag>[A-Za-z][\\w-]*)(?P<emptyAttributes>' + ATTRIBUTES + ')/>)' # <br/> --> <br/>
+    '|(?P<element><(?P<tag>[A-Za-z][\\w-]*)(?P<attributes>' + ATTRIBUTES + ')>(?P<content>.*?)</(?P=tag)>)' # <bi>text</bi>
+    '|!\\[(?P<alt>[^\\[\\]]+)\\]\\((?P<src>[^\\)]+)\\)' # ![text](src) --> <img src="src" alt="text"/>
+    '|\\[(?P<text>[^\\[\\]]+)\\]\\((?P<href>[^\\)]+)\\)' # [text](link) --> <a href="link">text</a>
+    '|\\*\\*(?P<b>.+?)\\*\\*' # **text** --> <b>text</b>
+    '|__(?P<strong>.+?)__' # __text__ --> <strong>text</strong>
+    '|\\*(?P<em>.+?)\\*' # *text* --> <em>text</em>
+    '|_(?P<i>.+?)_' # _text_ --> <i>text</i>
+    '|`(?P<code>.+?)`' # `text` --> <code>text</code>
+)
+
+def escapeXml(s):
+    """Answer the plain string `s` with XML special characters escaped.
+
+    >>> escapeXml('Fish & <Chips>')
+    'Fish &amp; &lt;Chips&gt;'
+    """
+    return s.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+def addText(node, prev, s):
+    """Add the string `s` to the tail of `prev` if it is defined, otherwise
+    to the text of `node`. Empty text stays None, as in ElementTree.
+    """
+    if s:
+        if prev is None:
+            node.text = (node.text or '') + s
+        else:
+            prev.tail = (prev.tail or '') + s
+
+def getAttributes(s):
+    """Answer the dictionary of the name="value" attributes in `s`.
+
+    >>> getAttributes(' class="x" alt="a &amp; b"')
+    {'class': 'x', 'alt': 'a & b'}
+    """
+    return {name: unescape(value) for name, value in ATTRIBUTE.findall(s)}
+
+def iterInline(s, node, prev=None):
+    """Generate the ('start', element) and ('end', element) events of the 
+    inline markdown in the line `s`, in a single scan, as children of `node`.
+    Text before the first child is added to the tail of `prev` if it is 
+    defined, otherwise to node.text. Answer the last child (or `prev`), 
+    that gets the tail of following text.
+    Well-formed inline tags, such as <br/> or <bi>text</bi>, are passed on
+    as XML elements, other "<" and "&" characters are text.
+
+    >>> p = Element('p')
+    >>> events = list(iterInline('And *now* [a **link**](http://a_b.com) & `x<y`', p))
+    >>> [(event, e.tag) for event, e in events][:4]
+    [('start', 'em'), ('end', 'em'), ('start', 'a'), ('start', 'b')]
+    >>> ''.join(iterXml([('start', p)] + events + [('end', p)]))
+    '<p>And <em>now</em> <a href="http://a_b.com">a <b>link</b></a> &amp; <code>x&lt;y</code></p>'
+    >>> p = Element('p')
+    >>> events = list(iterInline('**Bold <bi class="x">text</bi>.**<br/><br/> 1 < 2', p))
+    >>> ''.join(iterXml([('start', p)] + events + [('end', p)]))
+    '<p><b>Bold <bi class="x">text</bi>.</b><br/><br/> 1 &lt; 2</p>'
+    """
+    start = 0
+    for match in INLINE.finditer(s):
+        addText(node, prev, s[start:match.start()])
+        start = match.end()
+        kind = match.lastgroup
+        if kind == 'empty': # Empty inline tag, such as <br/>
+            child = Element(match.group('emptyTag'), getAttributes(match.group('emptyAttributes')))
+            yield 'start', child
+        elif kind == 'element': # Inline tag, that can contain other markdown.
+            child = Element(match.group('tag'), getAttributes(match.group('attributes')))
+            yield 'start', child
+            yield from iterInline(match.group('content'), child)
+        elif kind == 'src': # Image
+            child = Element('img', dict(src=match.group('src'), alt=match.group('alt')))
+            yield 'start', child
+        elif kind == 'href': # Link, that can contain other markdown.
+            child = Element('a', dict(href=match.group('href')))
+            yield 'start', child
+            yield from iterInline(match.group('text'), child)
+        elif kind == 'code': # No markdown inside code.
+            child = Element('code')
+            child.text = match.group('code')
+            yield 'start', child
+        else: # b, strong, em or i, that can contain other markdown.
+            child = Element(kind)
+            yield 'start', child
+            yield from iterInline(match.group(kind), child)
+        yield 'end', child
+        prev = child
+    addText(node, prev, s[start:])
+    return prev
+
+def parseHtml(s):
+    """Answer the element of the HTML line `s`, or None if it is not 
+    well-formed.
+
+    >>> parseHtml('<div class="x">Text</div>').attrib
+    {'class': 'x'}
+    >>> parseHtml('<div>') is None
+    True
+    """
+    try:
+        return fromstring(s)
+    except ParseError:
+        return None
+
+def iterElement(e):
+    """Generate the ('start', element) and ('end', element) events of 
+    element `e` and its children.
+    """
+    yield 'start', e
+    for child in e:
+        yield from iterElement(child)
+    yield 'end', e
+
+def isTextLine(s, html):
+    """Answer True if the stripped line `s` is plain text, that continues an
+    open paragraph or list item, instead of starting another block. `html`
+    is the parsed element of the line, if it is well-formed HTML.
+
+    >>> isTextLine('More text', None), isTextLine('**Bold** text', None)
+    (True, True)
+    >>> isTextLine('# Head', None), isTextLine('* Item', None), isTextLine('', None)
+    (False, False, False)
+    """
+    return bool(s) and html is None and not (FENCE.match(s) or HR.match(s) 
+        or HEAD.match(s) or QUOTE.match(s) or UL_ITEM.match(s) or OL_ITEM.match(s)
+        or IMAGE_LINE.match(s))
+
+def iterMarkdownEvents(lines):
+    """Generate the ('start', element) and ('end', element) events of the
+    markdown `lines` in a single pass, block by block, as ElementTree's
+    XMLPullParser does. The text and tail of the elements are complete 
+    at the next event. Only the open paragraph or list item has children,
+    so nothing is kept after they are used. The `lines` is an iterable of 
+    strings that each end with a newline, except the last line, such as an
+    open file.
+    Consecutive lines of lists and block quotes are combined. Consecutive
+    lines of text are one paragraph, and text lines after a list item
+    continue the item. The text of ~~~ fenced code is not parsed. Lines 
+    that start with "<" are parsed as HTML, if they are well-formed.
+
+    >>> events = list(iterMarkdownEvents(['# Head\\n', '* One\\n', '* Two\\n']))
+    >>> [(event, e.tag) for event, e in events]
+    [('start', 'xml'), ('start', 'h1'), ('end', 'h1'), ('start', 'ul'), ('start', 'li'), ('end', 'li'), ('start', 'li'), ('end', 'li'), ('end', 'ul'), ('end', 'xml')]
+    >>> events[1][1].text, events[1][1].tail
+    ('Head', '\\n')
+    >>> ''.join(iterXml(iterMarkdownEvents(['One\\n', '**two**\\n', '\\n', '- Item\\n', '[link](a.html)\\n'])))
+    '<xml><p>One\\n<b>two</b>\\n</p>\\n<ul><li>Item\\n<a href="a.html">link</a></li></ul>\\n</xml>'
     """
-    f = codecs.open(path, mode="r", encoding="utf-8") # Save the XML as unicode.
-    txt = f.read()
-    f.close()
-    txt = txt.replace('\r', '\n') # Just to be sure we have the right type of returns.
-    return parseMarkdown(txt)
+    root = Element('xml')
+    yield 'start', root
+    block = None # Last closed block, its tail gets the newlines that follow.
+    listNode = None # Open ul, ol or blockquote element.
+    item = None # Open li of the list, or last child of the open blockquote.
+    last = None # Last child in the open li, that gets the tail of the next line.
+    newline = None # Newline of the last line of the open list.
+    paragraph = None # Open p element, continued by following text lines.
+    fence = None # Open python element of ~~~ fenced code.
+    for line in lines:
+        s = line.rstrip('\r\n')
+        eol = line[len(s):] and '\n' # Normalized newline of this line, if any.
+        if fence is not None:
+            if FENCE.match(s): # Closing fence, anything after ~~~ is ignored.
+                yield 'end', fence
+                block, fence = fence, None
+                addText(root, block, eol)
+            else:
+                addText(fence, None, s + eol)
+            continue
+        html = None
+        if s.startswith('<'):
+            html = parseHtml(s)
+        isText = isTextLine(s, html)
+        # Lines of the open list or block quote, continue it.
+        if listNode is not None:
+            if listNode.tag == 'blockquote':
+                match = QUOTE.match(s)
+            elif listNode.tag == 'ul':
+                match = not HR.match(s) and UL_ITEM.match(s)
+            else:
+                match = OL_ITEM.match(s)
+            if match:
+                if listNode.tag == 'blockquote': # Lines are separated by <br/>
+                    br = Element('br')
+                    yield 'start', br
+                    yield 'end', br
+                    addText(listNode, br, newline)
+                    item = yield from iterInline(match.group(1), listNode, br)
+                else:
+                    yield 'end', item
+                    addText(listNode, item, newline)
+                    item = Element('li')
+                    yield 'start', item
+                    last = yield from iterInline(match.group(1), item)
+                newline = eol
+                continue
+            if isText and listNode.tag != 'blockquote': # Continues the list item.
+                addText(item, last, newline)
+                last = yield from iterInline(s, item, last)
+                newline = eol
+                continue
+            if listNode.tag != 'blockquote':
+                yield 'end', item
+            yield 'end', listNode # Close the list or block quote.
+            block, listNode = listNode, None
+            addText(root, block, newline)
+        if paragraph is not None:
+            if isText: # Continues the paragraph.
+                addText(paragraph, last, newline)
+                last = yield from iterInline(s, paragraph, last)
+                newline = eol
+                continue
+            addText(paragraph, last, newline)
+            yield 'end', paragraph
+            block, paragraph = paragraph, None
+        if FENCE.match(s):
+            fence = Element('python')
+            yield 'start', fence
+            addText(fence, None, eol) # Info string after ~~~ is ignored.
+        elif not s:
+            addText(root, block, eol)
+        elif html is not None:
+            yield from iterElement(html)
+            block = html
+            addText(root, block, eol)
+        elif HR.match(s):
+            block = Element('hr')
+            yield 'start', block
+            yield 'end', block
+            addText(root, block, eol)
+        elif HEAD.match(s):
+            match = HEAD.match(s)
+            block = Element('h%d' % len(match.group(1)))
+            yield 'start', block
+            yield from iterInline(match.group(2), block)
+            yield 'end', block
+            addText(root, block, eol)
+        elif QUOTE.match(s):
+            listNode = Element('blockquote')
+            yield 'start', listNode
+            item = yield from iterInline(QUOTE.match(s).group(1), listNode)
+            newline = eol
+        elif UL_ITEM.match(s) or OL_ITEM.match(s):
+            match = UL_ITEM.match(s)
+            listNode = Element('ul')
+            if match is None:
+                match = OL_ITEM.match(s)
+                listNode = Element('ol')
+            yield 'start', listNode
+            item = Element('li')
+            yield 'start', item
+            last = yield from iterInline(match.group(1), item)
+            newline = eol
+        elif IMAGE_LINE.match(s): # Image on its own line, not in a paragraph.
+            block = yield from iterInline(s, root, block)
+            addText(root, block, eol)
+        else:
+            paragraph = Element('p')
+            yield 'start', paragraph
+            last = yield from iterInline(s, paragraph)
+            newline = eol
+    if paragraph is not None:
+        addText(paragraph, last, newline)
+        yield 'end', paragraph
+    if listNode is not None:
+        if listNode.tag != 'blockquote':
+            yield 'end', item
+        yield 'end', listNode
+        addText(root, listNode, newline)
+    if fence is not None: # Unclosed fence at the end of the text.
+        yield 'end', fence
+    yield 'end', root
+
+def iterXml(events):
+    """Generate the XML fragments of the ('start', element) and ('end', 
+    element) events. The text of an element is written at the next event,
+    its tail at the event after its end.
+    """
+    pending = None # Element with text or tail to write at the next event.
+    pendingEvent = None
+    for event, e in events:
+        if pending is not None:
+            s = pending.text if pendingEvent == 'start' else pending.tail
+            if s:
+                yield escapeXml(s)
+        if event == 'start':
+            attributes = ''.join(' %s="%s"' % (name, escape(value)) 
+                for name, value in e.attrib.items())
+            if e.tag in EMPTY_TAGS:
+                yield '<%s%s/>' % (e.tag, attributes)
+            else:
+                yield '<%s%s>' % (e.tag, attributes)
+        elif e.tag not in EMPTY_TAGS:
+            yield '</%s>' % e.tag
+        pending, pendingEvent = e, event
+    if pending is not None and pending.tail:
+        yield escapeXml(pending.tail)
+
+def iterMarkdown(lines):
+    """Generate the XML fragments of the markdown `lines`, in a single pass,
+    see iterMarkdownEvents(). Text is XML-escaped.
+
+    >>> ''.join(iterMarkdown(['# Head\\n', '* One\\n', '* Two\\n', '\\n', 'Text & more']))
+    '<xml><h1>Head</h1>\\n<ul><li>One</li>\\n<li>Two</li></ul>\\n\\n<p>Text &amp; more</p></xml>'
+    >>> ''.join(iterMarkdown(['~~~python\\n', '# a < b\\n', '~~~\\n']))
+    '<xml><python>\\n# a &lt; b\\n</python>\\n</xml>'
+    >>> ''.join(iterMarkdown(['<div class="x">Some html</div>\\n', '> Quote **b**\\n', '> more\\n']))
+    '<xml><div class="x">Some html</div>\\n<blockquote>Quote <b>b</b><br/>\\nmore</blockquote>\\n</xml>'
+    """
+    return iterXml(iterMarkdownEvents(lines))
 
 def parseMarkdown(txt):
+    """Parse the markdown `txt` into an XML string, with the tags h1-h6, p,
+    ul, ol, li, blockquote, br, python, img, a, b, strong, em, i, code and hr.
+    The text is parsed in a single pass, line by line, see iterMarkdownEvents().
+
+    >>> xml = parseMarkdown('## Sub **head**\\n\\n> Quote\\n> more\\n\\n1. One\\n2. Two\\n---\\n')
+    >>> xml
+    '<xml><h2>Sub <b>head</b></h2>\\n\\n<blockquote>Quote<br/>\\nmore</blockquote>\\n\\n<ol><li>One</li>\\n<li>Two</li></ol>\\n<hr/>\\n</xml>'
+    >>> parseMarkdownFile('../../../resources/test.md') == parseMarkdownRegex(open('../../../resources/test.md').read())
+    True
+    """
+    return ''.join(iterMarkdown(txt.splitlines(True)))
+
+def splitMarkdownBlocks(lines):
+    """Generate the markdown `lines` as top-level blocks, each a string. A
+    block ends with the blank lines after it, except inside ~~~ fenced code,
+    or with the end of fenced code. There are no lists, quotes or fences 
+    open between blocks, so blocks can be parsed separately. Blank lines 
+    and fences are tested as iterMarkdownEvents() does, so a line with
+    only spaces continues the block, and an indented ~~~ is code.
+
+    >>> list(splitMarkdownBlocks(['# Head\\n', '\\n', '~~~\\n', 'a = 1\\n', '\\n', '~~~\\n', 'Text']))
+    ['# Head\\n\\n', '~~~\\na = 1\\n\\n~~~\\n', 'Text']
+    >>> for md in ('One\\n   \\nTwo\\n', '~~~\\n  ~~~\\n\\ncode line\\n~~~\\n\\nText\\n'):
+    ...     MarkdownParser().parse(md) == parseMarkdown(md)
+    True
+    True
+    """
+    block = []
+    done = False # Block is complete, the next non-blank line starts a new block.
+    inFence = False
+    for line in lines:
+        s = line.rstrip('\r\n')
+        if s and done: 
+            yield ''.join(block)
+            block = []
+        block.append(line)
+        if FENCE.match(s):
+            inFence = not inFence
+            done = not inFence # Closing fence ends the block.
+        elif not inFence:
+            done = not s
+    if block:
+        yield ''.join(block)
+
+def splitMarkdownChapters(lines, minLines=0):
+    """Generate the markdown `lines` as chapters, each a string, split
+    before the heading lines outside ~~~ fenced code. A heading closes any 
+    open list or quote, so the chapters can be parsed separately. Chapters
+    are combined until they have at least `minLines` lines.
+
+    >>> md = ['# One\\n', 'Text\\n', '~~~\\n', '# Code\\n', '~~~\\n', '## Two\\n', '* Item\\n', '# Three\\n']
+    >>> list(splitMarkdownChapters(md))
+    ['# One\\nText\\n~~~\\n# Code\\n~~~\\n', '## Two\\n* Item\\n', '# Three\\n']
+    >>> list(splitMarkdownChapters(md, minLines=6))
+    ['# One\\nText\\n~~~\\n# Code\\n~~~\\n## Two\\n* Item\\n', '# Three\\n']
+    """
+    chapter = []
+    inFence = False
+    for line in lines:
+        if FENCE.match(line):
+            inFence = not inFence
+        elif not inFence and chapter and len(chapter) >= minLines and HEAD.match(line.rstrip('\r\n')):
+            yield ''.join(chapter)
+            chapter = []
+        chapter.append(line)
+    if chapter:
+        yield ''.join(chapter)
+
+def parseMarkdownFragment(txt):
+    """Answer the XML of the markdown `txt`, without the root <xml> tags,
+    so that fragments of consecutive parts can be concatenated.
+
+    >>> parseMarkdownFragment('# Head\\n')
+    '<h1>Head</h1>\\n'
+    """
+    return ''.join(iterMarkdown(txt.splitlines(True)))[len('<xml>'):-len('</xml>')]
+
+def parseMarkdownParallel(txt, workers=None):
+    """Parse the markdown `txt` into an XML string, in a pool of `workers`
+    processes (default is the number of cpu's). The text is split into
+    chapters by splitMarkdownChapters(), about 4 for each worker, and the
+    parsed fragments are concatenated in order. The result is identical to
+    parseMarkdown(txt).
+
+    >>> import glob
+    >>> txt = ''.join(open(path).read() for path in sorted(glob.glob('../../../resources/*.md'))) * 20
+    >>> parseMarkdownParallel(txt, workers=3) == parseMarkdown(txt) # Parallel is identical to serial
+    True
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    lines = txt.splitlines(True)
+    chapters = list(splitMarkdownChapters(lines, len(lines) // (workers * 4)))
+    if workers > 1 and len(chapters) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            fragments = list(executor.map(parseMarkdownFragment, chapters))
+    else:
+        fragments = [parseMarkdownFragment(chapter) for chapter in chapters]
+    return '<xml>%s</xml>' % ''.join(fragments)
+
+class MarkdownParser:
+    """Incremental markdown parser. The source is split into top-level
+    blocks and the XML fragment of each block is kept, by the hash of the
+    block. Parsing an edited version of the source only parses the blocks
+    that changed. Only the fragments of the last parsed source are kept.
+
+    >>> md = open('../../../resources/test.md').read()
+    >>> parser = MarkdownParser()
+    >>> parser.parse(md) == parseMarkdown(md)
+    True
+    >>> len(parser.changed) == len(parser.digests) # All blocks are new
+    True
+    >>> md2 = md.replace('follow', 'lead')
+    >>> parser.parse(md2) == parseMarkdown(md2)
+    True
+    >>> parser.changed # Only the block with the edit is parsed again.
+    [1]
+    """
+    def __init__(self):
+        self.fragments = {} # Hash of block --> XML fragment.
+        self.digests = [] # Hashes of the blocks of the last parsed source.
+        self.changed = [] # Indices of the blocks that were parsed by the last call.
+
+    def __repr__(self):
+        return '<%s blocks=%d changed=%d>' % (self.__class__.__name__, 
+            len(self.digests), len(self.changed))
+
+    def parse(self, txt):
+        """Answer the XML of the markdown `txt`, as parseMarkdown() does,
+        using the fragments of the unchanged blocks of the previous call.
+        """
+        fragments = {}
+        self.digests = []
+        self.changed = []
+        for index, block in enumerate(splitMarkdownBlocks(txt.splitlines(True))):
+            digest = hashlib.blake2b(block.encode('utf-8'), digest_size=16).digest()
+            fragment = self.fragments.get(digest)
+            if fragment is None:
+                fragment = parseMarkdownFragment(block)
+                self.changed.append(index)
+            fragments[digest] = fragment
+            self.digests.append(digest)
+        self.fragments = fragments # Blocks of older versions are removed.
+        return '<xml>%s</xml>' % ''.join(fragments[digest] for digest in self.digests)
+
+def parseMarkdownRegex(txt):
+    """Regular expression based markdown parser, making a full pass over
+    the text for each markdown construct. Replaced by parseMarkdown(), 
+    kept for comparison in benchmarkMarkdown().
+    """
     # Solve Python comments inside <code>...</code>
     txt = re.sub('(\\~{3}[^#].*)#([^~]*\\1)$', '\\1<<pythonComment>>\\2', txt, flags=re.MULTILINE)
     # ~~~ ... ~~~ --> <code> ... </code>
@@ -81,8 +637,36 @@ def parseMarkdown(txt):
         txt = txt1
     return '<xml>%s</xml>' % txt
 
+def benchmarkMarkdown(txt, repeat=3):
+    """Answer the (parseMarkdown, parseMarkdownRegex) tuple with the best time
+    in seconds of `repeat` runs of each parser on the markdown `txt`. Run this
+    source with the -b argument to benchmark the resources/*.md files.
+
+    >>> t1, t2 = benchmarkMarkdown('# Head\\n\\nText\\n', repeat=1)
+    >>> t1 > 0 and t2 > 0
+    True
+    """
+    times = []
+    for parser in (parseMarkdown, parseMarkdownRegex):
+        best = None
+        for _ in range(repeat):
+            t = time.perf_counter()
+            parser(txt)
+            t = time.perf_counter() - t
+            if best is None or t < best:
+                best = t
+        times.append(best)
+    return tuple(times)
 
 if __name__ == "__main__":
     # Running this document will execute all >>> comments as test of this source.
     import doctest
-    doctest.testmod()[0]
\ No newline at end of file
+    doctest.testmod()[0]
+    import sys
+    if '-b' in sys.argv: 
+        # Benchmark with the markdown resources, repeated to make a large text.
+        import glob
+        txt = ''.join(open(path).read() for path in glob.glob('../../../resources/*.md')) * 200
+        t1, t2 = benchmarkMarkdown(txt)
+        print('%d lines: parseMarkdown %0.3fs, parseMarkdownRegex %0.3fs (%0.1fx)' % (
+            txt.count('\n'), t1, t2, t2/t1))
\ No newline at end of file
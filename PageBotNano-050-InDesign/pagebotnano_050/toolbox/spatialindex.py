@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#   P A G E B O T  N A N O
+#
+#   Copyright (c) 2020+ Buro Petr van Blokland + Claudia Mens
+#   www.pagebot.io
+#   Licensed under MIT conditions
+#
+#   Supporting DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#   spatialindex.py
+#
+#   The SpatialIndex keeps the bounding boxes of elements in a uniform grid,
+#   so overlapping elements, elements at a point and nearest elements can be
+#   found without testing all elements of a page.
+#
+from heapq import nsmallest
+from math import floor, hypot
+
+# Default size of the grid cells in points.
+DEFAULT_CELL_SIZE = 64
+
+class SpatialIndex:
+    """Uniform grid of (x1, y1, x2, y2) boxes of elements. Each element is
+    kept in all cells that its box overlaps, so queries only need to test
+    the elements in the cells of the query. Boxes are updated incrementally,
+    by self.update(e, box), e.g. when an element moved or changed size.
+    Boxes that touch count as overlapping. Results are in the order that
+    the elements were added.
+
+    >>> from pagebotnano.elements import Element
+    >>> index = SpatialIndex(cellSize=100)
+    >>> e1, e2, e3 = Element(name='e1'), Element(name='e2'), Element(name='e3')
+    >>> index.update(e1, (0, 0, 50, 50))
+    >>> index.update(e2, (40, 40, 250, 60))
+    >>> index.update(e3, (500, 500, 510, 510))
+    >>> [e.name for e in index.findInRect(45, 45, 10, 10)]
+    ['e1', 'e2']
+    >>> [e.name for e in index.findAtPoint(200, 50)]
+    ['e2']
+    >>> [e.name for e in index.findNearest(400, 400, 2)]
+    ['e3', 'e2']
+    >>> index.update(e3, (0, 0, 10, 10)) # Moved
+    >>> [e.name for e in index.findAtPoint(5, 5)]
+    ['e1', 'e3']
+    >>> index.remove(e1)
+    >>> len(index), [e.name for e in index.findInRect(0, 0, 100, 100)]
+    (2, ['e2', 'e3'])
+    """
+    def __init__(self, cellSize=DEFAULT_CELL_SIZE):
+        self.cellSize = cellSize
+        self.boxes = {} # Element --> (sequence, (x1, y1, x2, y2))
+        self.cells = {} # (column, row) --> dict of elements, used as ordered set.
+        self.sequence = 0
+        # Cached (minColumn, minRow, maxColumn, maxRow) of the cells, None if
+        # it needs to be calculated again, see self._getBounds().
+        self._bounds = None
+
+    def __repr__(self):
+        return '<%s elements=%d cells=%d>' % (self.__class__.__name__,
+            len(self.boxes), len(self.cells))
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def __contains__(self, e):
+        return e in self.boxes
+
+    def _iterCells(self, x1, y1, x2, y2):
+        cellSize = self.cellSize
+        for column in range(floor(x1/cellSize), floor(x2/cellSize) + 1):
+            for row in range(floor(y1/cellSize), floor(y2/cellSize) + 1):
+                yield column, row
+
+    def update(self, e, box):
+        """Add the element `e` with the absolute (x1, y1, x2, y2) `box` to
+        the index, or move it if it already exists.
+        """
+        x1, y1, x2, y2 = box
+        box = min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)
+        entry = self.boxes.get(e)
+        if entry is not None:
+            if entry[1] == box: # Not changed.
+                return
+            self.remove(e)
+            sequence = entry[0] # Keep the order of the element.
+        else:
+            self.sequence += 1
+            sequence = self.sequence
+        self.boxes[e] = sequence, box
+        for cell in self._iterCells(*box):
+            if cell not in self.cells:
+                self.cells[cell] = {}
+                if self._bounds is not None: # Extend the cached bounds.
+                    column, row = cell
+                    minColumn, minRow, maxColumn, maxRow = self._bounds
+                    self._bounds = (min(minColumn, column), min(minRow, row), 
+                        max(maxColumn, column), max(maxRow, row))
+            self.cells[cell][e] = None
+
+    def remove(self, e):
+        """Remove the element `e` from the index, if it exists."""
+        entry = self.boxes.pop(e, None)
+        if entry is not None:
+            for cell in self._iterCells(*entry[1]):
+                elements = self.cells[cell]
+                del elements[e]
+                if not elements:
+                    del self.cells[cell]
+                    if self._bounds is not None:
+                        column, row = cell
+                        minColumn, minRow, maxColumn, maxRow = self._bounds
+                        if column in (minColumn, maxColumn) or row in (minRow, maxRow):
+                            self._bounds = None # Boundary cell, calculate again.
+
+    def _getBounds(self):
+        """Answer the (minColumn, minRow, maxColumn, maxRow) of the cells
+        that contain elements. The value is cached, updated by self.update()
+        and calculated again after a cell on the boundary got empty.
+
+        >>> from pagebotnano.elements import Element
+        >>> index = SpatialIndex(cellSize=100)
+        >>> e1, e2 = Element(), Element()
+        >>> index.update(e1, (0, 0, 50, 50))
+        >>> index.update(e2, (-150, 120, -110, 130))
+        >>> index._getBounds()
+        (-2, 0, 0, 1)
+        >>> index.remove(e2)
+        >>> index._getBounds()
+        (0, 0, 0, 0)
+        """
+        if self._bounds is None:
+            columns = [column for column, _ in self.cells]
+            rows = [row for _, row in self.cells]
+            self._bounds = min(columns), min(rows), max(columns), max(rows)
+        return self._bounds
+
+    def _iterRing(self, column, row, ring):
+        """Answer the cells on the square ring at distance `ring` around 
+        cell (column, row).
+
+        >>> sorted(SpatialIndex()._iterRing(0, 0, 1))
+        [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+        """
+        if ring == 0:
+            yield column, row
+            return
+        for c in range(column - ring, column + ring + 1): # Bottom and top row
+            yield c, row - ring
+            yield c, row + ring
+        for r in range(row - ring + 1, row + ring): # Left and right column
+            yield column - ring, r
+            yield column + ring, r
+
+    def getBox(self, e):
+        """Answer the (x1, y1, x2, y2) box of `e`, or None if it does not exist."""
+        entry = self.boxes.get(e)
+        if entry is None:
+            return None
+        return entry[1]
+
+    def _sorted(self, elements):
+        return sorted(elements, key=lambda e: self.boxes[e][0])
+
+    def findInRect(self, x, y, w, h):
+        """Answer the list of elements with a box that overlaps the rectangle
+        (x, y, w, h).
+        """
+        x1, y1, x2, y2 = min(x, x + w), min(y, y + h), max(x, x + w), max(y, y + h)
+        found = set()
+        for cell in self._iterCells(x1, y1, x2, y2):
+            for e in self.cells.get(cell, ()):
+                if e not in found:
+                    bx1, by1, bx2, by2 = self.boxes[e][1]
+                    if bx1 <= x2 and x1 <= bx2 and by1 <= y2 and y1 <= by2:
+                        found.add(e)
+        return self._sorted(found)
+
+    def findAtPoint(self, x, y):
+        """Answer the list of elements with a box that contains the point (x, y)."""
+        return self.findInRect(x, y, 0, 0)
+
+    def getDistance(self, e, x, y):
+        """Answer the distance of the point (x, y) to the box of `e`. The
+        distance is 0 if the point is inside the box.
+        """
+        x1, y1, x2, y2 = self.boxes[e][1]
+        dx = max(x1 - x, 0, x - x2)
+        dy = max(y1 - y, 0, y - y2)
+        return hypot(dx, dy)
+
+    def findNearest(self, x, y, count=1):
+        """Answer the list of the `count` elements with a box nearest to the
+        point (x, y), nearest first. The cells are searched in rings around
+        the point, until no unsearched cell can have a nearer element.
+
+        >>> from pagebotnano.elements import Element
+        >>> index = SpatialIndex(cellSize=10)
+        >>> elements = [Element(name='e%d' % n) for n in range(5)]
+        >>> for n, e in enumerate(elements):
+        ...     index.update(e, (n*100, 0, n*100 + 5, 5))
+        >>> [e.name for e in index.findNearest(290, 0, 3)]
+        ['e3', 'e2', 'e4']
+        >>> [e.name for e in index.findNearest(-1000, 1000)]
+        ['e0']
+        """
+        if not self.cells:
+            return []
+        cellSize = self.cellSize
+        column, row = floor(x/cellSize), floor(y/cellSize)
+        minColumn, minRow, maxColumn, maxRow = self._getBounds()
+        # Number of rings that covers all cells.
+        maxRing = max(abs(column - minColumn), abs(column - maxColumn),
+            abs(row - minRow), abs(row - maxRow))
+        distances = {} # Element --> distance
+        for ring in range(maxRing + 1):
+            for cell in self._iterRing(column, row, ring):
+                for e in self.cells.get(cell, ()):
+                    if e not in distances:
+                        distances[e] = self.getDistance(e, x, y)
+            # Elements outside the searched rings are at least this far away.
+            if len(distances) >= count and nsmallest(count, distances.values())[-1] <= ring*cellSize:
+                break
+        found = sorted(distances, key=lambda e: (distances[e], self.boxes[e][0]))
+        return found[:count]
+
+if __name__ == "__main__":
+    # Running this document will execute all >>> comments as test of this source.
+    import doctest
+    doctest.testmod()[0]
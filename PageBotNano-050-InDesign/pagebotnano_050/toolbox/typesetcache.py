@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+# -----------------------------------------------------------------------------
+#
+#   P A G E B O T  N A N O
+#
+#   Copyright (c) 2020+ Buro Petr van Blokland + Claudia Mens
+#   www.pagebot.io
+#   Licensed under MIT conditions
+#
+#   Supporting DrawBot, www.drawbot.com
+# -----------------------------------------------------------------------------
+#
+#   typesetcache.py
+#
+#   The TypesetCache stores typeset galley fragments on disk, so unchanged
+#   files don't need to be parsed and typeset again.
+#
+import os
+import hashlib
+import marshal
+import sys
+sys.path.insert(0, "../..") # So we can import pagebotnano without installing.
+
+from pagebotnano.babelstring import encodeValue
+
+# Default maximum total size of the cached files in bytes.
+DEFAULT_CACHE_SIZE = 256*1024*1024
+CACHE_EXTENSION = '.pbnc'
+
+def getStylesHash(styles):
+    """Answer the hex digest of the styles dictionary, that is the same for
+    equal styles, in any order. A "tag" entry that is equal to the tag of
+    the style is ignored, as the typesetter adds it on usage.
+
+    >>> from pagebotnano.toolbox.color import Color
+    >>> h1 = getStylesHash(dict(p=dict(font='Georgia', textFill=Color(1, 0, 0))))
+    >>> h2 = getStylesHash(dict(p=dict(textFill=Color(1, 0, 0), font='Georgia', tag='p')))
+    >>> h1 == h2, h1 == getStylesHash(dict(p=dict(font='Verdana')))
+    (True, False)
+    """
+    packed = []
+    for tag, style in sorted((styles or {}).items()):
+        packed.append((tag, tuple(sorted((name, encodeValue(value))
+            for name, value in style.items() if not (name == 'tag' and value == tag)))))
+    return hashlib.sha256(marshal.dumps(tuple(packed))).hexdigest()
+
+def getFileHash(path):
+    """Answer the hex digest of the content of the file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(64*1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class TypesetCache:
+    """Stores bytes on disk in the `path` folder, with a key made from the
+    content of the source file, the styles and the version of the typesetter.
+    If the total size exceeds `maxSize`, then the least recently used files
+    are removed. The number of hits and misses is counted.
+
+    >>> import tempfile
+    >>> cache = TypesetCache(tempfile.mkdtemp(), maxSize=10)
+    >>> cache.get('a') is None
+    True
+    >>> cache.set('a', b'123456')
+    >>> cache.get('a')
+    b'123456'
+    >>> cache.set('b', b'7890')
+    >>> cache.get('a') # Use "a", so "b" is least recently used
+    b'123456'
+    >>> cache.set('c', b'ABC') # Exceeds the size, "b" is removed.
+    >>> cache.get('b'), cache.get('c'), len(cache), cache.size
+    (None, b'ABC', 2, 9)
+    >>> cache.hits, cache.misses
+    (3, 2)
+    """
+    def __init__(self, path, maxSize=DEFAULT_CACHE_SIZE):
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self.path = path
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        # Index of the cached files: key --> size, in order of last usage.
+        # Initialized from the files in the folder, oldest first.
+        self.index = {}
+        entries = []
+        for fileName in os.listdir(path):
+            if fileName.endswith(CACHE_EXTENSION):
+                stat = os.stat(os.path.join(path, fileName))
+                entries.append((stat.st_mtime, fileName[:-len(CACHE_EXTENSION)], stat.st_size))
+        for _, key, size in sorted(entries):
+            self.index[key] = size
+        self.size = sum(self.index.values())
+
+    def __repr__(self):
+        return '<%s files=%d hits=%d misses=%d>' % (self.__class__.__name__,
+            len(self), self.hits, self.misses)
+
+    def __len__(self):
+        return len(self.index)
+
+    def getKey(self, path, styles, version):
+        """Answer the key of the file `path` for the styles and the version
+        of the typesetter. Images and PDF's are referred to by their path in
+        the galley, so then the path is part of the key too.
+        """
+        key = [getFileHash(path), getStylesHash(styles), str(version)]
+        if not path.lower().endswith(('.md', '.txt', '.xml', '.html', '.svg')):
+            key.append(os.path.abspath(path))
+        return hashlib.sha256('/'.join(key).encode('utf-8')).hexdigest()
+
+    def _getPath(self, key):
+        return os.path.join(self.path, key + CACHE_EXTENSION)
+
+    def get(self, key):
+        """Answer the cached bytes of `key`, or None if it does not exist."""
+        if key in self.index:
+            try:
+                with open(self._getPath(key), 'rb') as f:
+                    data = f.read()
+            except OSError: # Removed by another process.
+                self.size -= self.index.pop(key)
+            else:
+                self.hits += 1
+                self.index[key] = self.index.pop(key) # Most recently used.
+                os.utime(self._getPath(key)) # Keep the order for the next session.
+                return data
+        self.misses += 1
+        return None
+
+    def set(self, key, data):
+        """Store the `data` bytes as `key`. Then remove the least recently
+        used files, until the total size fits in self.maxSize.
+        """
+        path = self._getPath(key)
+        tmpPath = path + '.tmp'
+        with open(tmpPath, 'wb') as f:
+            f.write(data)
+        os.replace(tmpPath, path) # Other processes never read a partial file.
+        if key in self.index:
+            self.size -= self.index.pop(key)
+        self.index[key] = len(data)
+        self.size += len(data)
+        while self.size > self.maxSize and len(self.index) > 1:
+            oldKey = next(iter(self.index))
+            self.size -= self.index.pop(oldKey)
+            try:
+                os.remove(self._getPath(oldKey))
+            except OSError:
+                pass
+
+if __name__ == "__main__":
+    # Running this document will execute all >>> comments as test of this source.
+    import doctest
+    doctest.testmod()[0]
@@ -21,20 +21,190 @@
 #   from the typesetter office, to be composed on pages.
 #
 import os
+import marshal
+from concurrent.futures import ProcessPoolExecutor
+from difflib import SequenceMatcher
+from functools import partial
 from xml.etree import ElementTree as ET
 import sys
 sys.path.insert(0, "../..") # So we can import pagebotnano without installing.
 
-from pagebotnano.babelstring import BabelString
-from pagebotnano.toolbox.markdown import parseMarkdownFile, parseMarkdown
+from pagebotnano.babelstring import (BabelString, BabelStringBuilder, 
+    internStyle, packStyles, unpackStyles, packString, unpackString, encodeValue, 
+    decodeValue, dumpPayload, loadPayload)
+from pagebotnano.toolbox.assetresolver import AssetResolver
+from pagebotnano.toolbox.markdown import (parseMarkdown, iterMarkdownEvents, 
+    iterMarkdownLines, MarkdownParser)
 from pagebotnano.elements import Element, TextBox, Image, CodeBlock
 from pagebotnano.toolbox import extensionOf, fileNameOf
 from pagebotnano.constants import DEFAULT_WIDTH
 
+# Number of characters read from a file for each step of Typesetter.typesetStream()
+STREAM_CHUNK_SIZE = 64*1024
+
 class Galley(Element):
     def __repr__(self):
         return '<%s elements=%d>' % (self.__class__.__name__, len(self.elements))
 
+    def asBytes(self):
+        """Answer the typeset content of the galley as compact bytes string,
+        so it can be stored and loaded again by Galley.fromBytes(), without
+        parsing and typesetting the source again. All TextBox elements 
+        share one style table.
+
+        >>> xml = '<xml><h1>Head</h1><p>This is a tagged text</p><python>a = 1</python></xml>'
+        >>> styles = dict(h1=dict(font='Georgia-Bold', fontSize=24), p=dict(font='Georgia', fontSize=10))
+        >>> g = Typesetter(Galley(w=300)).typeset(xml, styles)
+        >>> g2 = Galley.fromBytes(g.asBytes())
+        >>> g2
+        <Galley elements=2>
+        >>> g2.elements[0].bs.html == g.elements[0].bs.html
+        True
+        >>> [(e2.w, e2.code) for e2 in g2.elements[1:]] == [(e.w, e.code) for e in g.elements[1:]]
+        True
+        >>> [e.w for e in g2.elements]
+        [300, 300]
+        >>> g = Galley()
+        >>> e = g.addElement(Image('images/moved.jpg', resolved=True))
+        >>> Galley.fromBytes(g.asBytes()).elements[0].path # Not checked again
+        'images/moved.jpg'
+        """
+        styleIds = {}
+        elements = []
+        for e in self.elements:
+            attributes = (e.x, e.y, e.w, e.h, e.name, encodeValue(e.fill), 
+                encodeValue(e.stroke), e.strokeWidth)
+            if isinstance(e, CodeBlock):
+                elements.append(('CodeBlock', attributes, e.code))
+            elif isinstance(e, TextBox):
+                elements.append(('TextBox', attributes, packString(e.bs, styleIds)))
+            elif isinstance(e, Image):
+                elements.append(('Image', attributes, e.path))
+            else:
+                raise ValueError('%s.asBytes: Cannot serialize element %s' % (self.__class__.__name__, e))
+        return dumpPayload((packStyles(styleIds), tuple(elements)))
+
+    def diff(self, galley):
+        """Answer the list of indices of the elements in self that are new,
+        changed or moved, compared with the elements of the previous `galley`,
+        so composition only needs to update the pages of those elements.
+        The elements are compared in sequence, so inserted copies of existing
+        elements and reordered elements are reported too. If elements were 
+        removed, then the element that follows them is reported, as it moved.
+        Elements flow over the pages in order, so the pages from the first
+        answered index on may change.
+
+        >>> styles = dict(p=dict(font='Georgia'))
+        >>> parser = MarkdownParser()
+        >>> md = 'Text\\n\\n~~~\\na = 1\\n~~~\\n\\nMore text\\n'
+        >>> g1 = Typesetter().typesetMarkdown(md, styles, parser)
+        >>> g2 = Typesetter().typesetMarkdown(md.replace('More', 'Other'), styles, parser)
+        >>> g1.elements
+        [<TextBox name=TextBox w=100 h=None>, <CodeBlock code=;;a = 1;>, <TextBox name=TextBox w=100 h=None>]
+        >>> parser.changed, g2.diff(g1) # Only the last block is parsed, the last TextBox changed
+        ([2], [2])
+        >>> def makeGalley(codes):
+        ...     g = Galley()
+        ...     for code in codes:
+        ...         g.addElement(CodeBlock(code))
+        ...     return g
+        >>> g1, g2 = makeGalley('abc'), makeGalley('aabc') # Inserted a copy
+        >>> g2.diff(g1), g1.diff(g2) # Inserted, and removed again.
+        ([0], [0])
+        >>> makeGalley('acb').diff(g1) # Reordered
+        [1]
+        """
+        styleIds = {} # Shared, so equal styles get the same id in both galleys.
+        previous = [self._getFingerprint(e, styleIds) for e in galley.elements]
+        current = [self._getFingerprint(e, styleIds) for e in self.elements]
+        changed = []
+        matcher = SequenceMatcher(None, previous, current, autojunk=False)
+        for tag, _, _, j1, j2 in matcher.get_opcodes():
+            if tag in ('replace', 'insert'):
+                changed.extend(range(j1, j2))
+            elif tag == 'delete' and j1 < len(current) and j1 not in changed:
+                changed.append(j1) # Element after the removed ones moved.
+        return changed
+
+    def _getFingerprint(self, e, styleIds):
+        """Answer a tuple that is equal for elements with equal content."""
+        attributes = marshal.dumps((e.x, e.y, e.w, e.h, e.name, encodeValue(e.fill), 
+            encodeValue(e.stroke), e.strokeWidth))
+        if isinstance(e, CodeBlock):
+            return 'CodeBlock', attributes, e.code
+        if isinstance(e, TextBox):
+            return 'TextBox', attributes, packString(e.bs, styleIds)
+        if isinstance(e, Image):
+            return 'Image', attributes, e.path
+        return e.__class__.__name__, id(e) # Unknown elements always changed.
+
+    @classmethod
+    def fromBytes(cls, data, galley=None):
+        """Answer a galley with the elements from data created by 
+        Galley.asBytes(). If `galley` is defined, then add the elements to it.
+        """
+        (packedStyles, elements), byteOrder = loadPayload(data)
+        styles = unpackStyles(packedStyles)
+        if galley is None:
+            galley = cls()
+        for className, attributes, content in elements:
+            x, y, w, h, name, fill, stroke, strokeWidth = attributes
+            kwargs = dict(x=x, y=y, w=w, h=h, name=name, fill=decodeValue(fill),
+                stroke=decodeValue(stroke), strokeWidth=strokeWidth)
+            if className == 'CodeBlock':
+                galley.addElement(CodeBlock(content, **kwargs))
+            elif className == 'TextBox':
+                bs = unpackString(content, styles, byteOrder)
+                galley.addElement(TextBox(bs, **kwargs))
+            else: # className == 'Image', path was resolved by the typesetter.
+                galley.addElement(Image(content, resolved=True, **kwargs))
+        return galley
+
+def _typesetFragment(job):
+    """Typeset a single file in a worker process of Typesetter.typesetFiles().
+    Answer the (galleyBytes, verbose, assets) tuple, where assets are the
+    (reference, resolvedPath, mtime) of the images, see 
+    Typesetter.isFragmentValid().
+    """
+    typesetterClass, path, styles, w, assetsClass, searchPaths = job
+    ts = typesetterClass(Galley(w=w), assets=assetsClass(searchPaths))
+    ts.typesetFile(path, styles)
+    assets = tuple((reference, resolved, getModificationTime(resolved)) 
+        for reference, resolved in ts.assets.paths.items())
+    return ts.galley.asBytes(), tuple(ts.verbose), assets
+
+def getModificationTime(path):
+    """Answer the modification time of the file `path`, or None if it is
+    undefined or does not exist.
+
+    >>> getModificationTime(None), getModificationTime('noFile.jpg')
+    (None, None)
+    """
+    if path is None:
+        return None
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+def getSelectors(styles):
+    """Answer the dictionary tag --> list of (ancestors, style) for the 
+    compound selectors in `styles`, such as "h3 b". The lists are sorted
+    by increasing number of ancestors, so more specific selectors are 
+    applied later in the cascade.
+
+    >>> getSelectors({'ul li b': dict(font='Bold'), 'h3 b': dict(fontSize=20), 'p': {}})
+    {'b': [(('h3',), {'fontSize': 20}), (('ul', 'li'), {'font': 'Bold'})]}
+    """
+    selectors = {}
+    for selector, style in styles.items():
+        tags = selector.split()
+        if len(tags) > 1:
+            selectors.setdefault(tags[-1], []).append((tuple(tags[:-1]), style))
+    for tagSelectors in selectors.values():
+        tagSelectors.sort(key=lambda selector: len(selector[0]))
+    return selectors
+
 class Typesetter:
     """Typesetter takes one or a series of inputs, converts them to
     BabelString and elements, and adds thoses to the supplied galley.
@@ -44,7 +214,15 @@ class Typesetter:
     <Galley elements=0>
      
     """
-    def __init__(self, galley=None):
+    # Version of the typesetting result. Increment on changes in the output,
+    # so that galley fragments in a TypesetCache are no longer used.
+    VERSION = 2
+
+    def __init__(self, galley=None, cache=None, assets=None):
+        self.cache = cache # Optional TypesetCache instance for typeset files.
+        if assets is None: # Resolves the image paths, scanning each folder once.
+            assets = AssetResolver()
+        self.assets = assets
         self.reset(galley)
 
     def reset(self, galley=None):
@@ -54,12 +232,64 @@ class Typesetter:
         self.galley = galley
 
         self.verbose = [] # Storage for errors/warnings during processing.
+        self.missingImages = [] # Image references that don't exist, reported together.
+        self.fileVerbose = {} # Warnings of each path, typeset by self.typesetFiles()
+        self.unknownTags = set() # Tags that are not supported by the typesetter.
+        self.unstyledTags = set() # Supported tags without a style.
+        # Compiled table of tag path --> (openHandler, closeHandler, style), 
+        # for the styles that are used by the current self.typeset() call.
+        self.dispatch = {}
+        self.dispatchStyles = None 
+        self.selectors = {} # Compound selectors of the styles, see getSelectors()
+        # Text is collected by a BabelStringBuilder for each TextBox,
+        # until self.flush() builds their BabelString in a single pass.
+        self.builders = {} 
 
     def typesetFile(self, path, styles=None):
         """Typeset the content of the file: .md, .txt or any kind of 
         image). Depending on the kind of file, different actions are taken.
+        If self.cache is defined, then the galley fragment of the file is 
+        taken from the cache, if the file, styles and version are unchanged.
+
+        >>> import tempfile
+        >>> from pagebotnano.toolbox.typesetcache import TypesetCache
+        >>> cache = TypesetCache(tempfile.mkdtemp())
+        >>> path = '../../../resources/test.md'
+        >>> g1 = Typesetter(cache=cache).typesetFile(path)
+        >>> g2 = Typesetter(cache=cache).typesetFile(path)
+        >>> cache
+        <TypesetCache files=1 hits=1 misses=1>
+        >>> g1.asBytes() == g2.asBytes() == Typesetter().typesetFile(path).asBytes()
+        True
+        >>> ts1, ts2 = Typesetter(cache=cache), Typesetter()
+        >>> for p in (path, path, '../../../resources/images/cookbot1.jpg'):
+        ...     g1, g2 = ts1.typesetFile(p), ts2.typesetFile(p)
+        >>> ts1.verbose == ts2.verbose # Same warnings, cached or not.
+        True
+
+        Images are checked again on a cache hit, so adding a missing image
+        typesets the file again.
+
+        >>> folder = tempfile.mkdtemp()
+        >>> path = os.path.join(folder, 'images.xml')
+        >>> _ = open(path, 'w').write('<xml><img src="%s/a.jpg"/></xml>' % folder)
+        >>> len(Typesetter(cache=cache).typesetFile(path).elements)
+        0
+        >>> import shutil
+        >>> _ = shutil.copy('../../../resources/images/cookbot1.jpg', os.path.join(folder, 'a.jpg'))
+        >>> Typesetter(cache=cache).typesetFile(path).elements
+        [<Image file=a.jpg w=None h=None>]
         """
-        assert path is not None or xml is not None
+        assert path is not None
+        if self.cache is not None:
+            key = self.getCacheKey(path, styles)
+            data = self.cache.get(key)
+            fragment = None if data is None else loadPayload(data)[0]
+            if fragment is None or not self.isFragmentValid(fragment):
+                fragment = _typesetFragment(self.getJob(path, styles))
+                self.cache.set(key, dumpPayload(fragment))
+            galleyData, verbose, _ = fragment
+            return self.addFragment(path, galleyData, verbose, prefix=False)
         extension = extensionOf(path)
         if extension in ('jpg', 'png', 'gif'):
             # This is an image, create the html tag link code for it.
@@ -68,18 +298,164 @@ class Typesetter:
             # This is a PDF file, in html we can only link to it.
             xml = '<xml><a href="%s">%s</a></xml>' % (path, fileNameOf(path))
         elif extension in ('svg', 'html', 'xml'):
-            # This is an XML-tagged document. We can directly parse it
-            root = ET.fromFile(path)
-            self.typesetNode(root, self.galley, styles)
+            # This is an XML-tagged document. We can directly parse it,
+            # streaming from the file.
+            return self.typesetStream(path, styles)
         elif extension in ('md', 'txt'):
-            xml = parseMarkdownFile(path)
+            # Markdown is typeset from the parser events, reading the file
+            # line by line from a memory map, without an intermediate XML string.
+            return self.typesetEvents(iterMarkdownEvents(iterMarkdownLines(path)), styles)
         # Answer the galley for convenience of the caller
         return self.typeset(xml, styles) 
 
-    def typesetMarkdown(self, md, style):
-        xml = parseMarkdown(md)
+    def typesetFiles(self, paths, styles=None, workers=None):
+        """Typeset the files in `paths` in a pool of `workers` processes
+        (default is the number of cpu's). Each worker answers its galley as 
+        serialized fragment. The fragments are merged into self.galley in the 
+        order of `paths`, so the result is the same as calling 
+        self.typesetFile for each path. The warnings of each file are kept in 
+        self.fileVerbose and added to self.verbose, preceded by the file name.
+        If self.cache is defined, then only files that are not cached are 
+        typeset.
+
+        >>> paths = ['../../../resources/test.md', '../../../resources/images/cookbot1.jpg'] * 2
+        >>> paths.append('../../../resources/test.md') # Continues the last TextBox
+        >>> ts = Typesetter()
+        >>> g = ts.typesetFiles(paths, workers=2)
+        >>> ts.fileVerbose['../../../resources/images/cookbot1.jpg']
+        ['Node "xml" has no supporting style', 'Node "img" has no supporting style']
+        >>> 'cookbot1.jpg: Node "img" has no supporting style' in ts.verbose
+        True
+        >>> ts2 = Typesetter()
+        >>> for path in paths:
+        ...     g2 = ts2.typesetFile(path)
+        >>> g.asBytes() == g2.asBytes() # Same as typesetting file by file.
+        True
+
+        The workers resolve images with the search paths of self.assets.
+
+        >>> import tempfile
+        >>> path = os.path.join(tempfile.mkdtemp(), 'images.xml')
+        >>> _ = open(path, 'w').write('<xml><img src="images/cookbot1.jpg"/></xml>')
+        >>> ts = Typesetter(assets=AssetResolver(['../../../resources']))
+        >>> ts.typesetFiles([path, path], workers=2).elements
+        [<Image file=cookbot1.jpg w=None h=None>, <Image file=cookbot1.jpg w=None h=None>]
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        fragments = [None] * len(paths) # (galleyBytes, verbose) of each path.
+        keys = {}
+        if self.cache is not None: # Only typeset the files that are not cached.
+            for index, path in enumerate(paths):
+                keys[index] = key = self.getCacheKey(path, styles)
+                data = self.cache.get(key)
+                if data is not None:
+                    fragment = loadPayload(data)[0]
+                    if self.isFragmentValid(fragment):
+                        fragments[index] = fragment
+        todo = [index for index, fragment in enumerate(fragments) if fragment is None]
+        jobs = [self.getJob(paths[index], styles) for index in todo]
+        workers = min(workers, len(jobs))
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(_typesetFragment, jobs))
+        else: # Not worth the overhead of processes.
+            results = [_typesetFragment(job) for job in jobs]
+        for index, fragment in zip(todo, results):
+            fragments[index] = fragment
+            if self.cache is not None:
+                self.cache.set(keys[index], dumpPayload(fragment))
+
+        for path, (data, verbose, _) in zip(paths, fragments):
+            self.addFragment(path, data, verbose)
+        return self.galley # Answer the galley for convenience of the caller
+
+    def getVersion(self):
+        """Answer the version of the typeset result of this class, as used 
+        in the key of cached galley fragments.
+
+        >>> Typesetter().getVersion()
+        'Typesetter-2'
+        """
+        return '%s-%s' % (self.__class__.__name__, self.VERSION)
+
+    def getCacheKey(self, path, styles):
+        """Answer the key of the galley fragment of `path` in self.cache. The
+        current folder and the search paths of self.assets are part of the 
+        key, as they change the resolved image paths.
+        """
+        searchPaths = os.pathsep.join(os.path.abspath(searchPath) 
+            for searchPath in self.assets.searchPaths)
+        return self.cache.getKey(path, styles, '%s %s %s' % (self.getVersion(), 
+            os.getcwd(), searchPaths))
+
+    def isFragmentValid(self, fragment):
+        """Answer the boolean flag if the images of the cached `fragment` 
+        still resolve to the same files, with the same modification time. 
+        Missing images that were added, or images that changed, make the
+        fragment invalid, so the file is typeset again.
+        """
+        for reference, resolved, mtime in fragment[2]:
+            resolvedNow = self.assets.resolve(reference)
+            if resolvedNow != resolved or getModificationTime(resolvedNow) != mtime:
+                return False
+        return True
+
+    def getJob(self, path, styles):
+        """Answer the job for _typesetFragment() to typeset a single file,
+        including the configuration of self, so the worker typesets the file
+        in the same way as self would.
+        """
+        return (self.__class__, path, styles, self.galley.w, self.assets.__class__, 
+            tuple(self.assets.searchPaths))
+
+    def addFragment(self, path, data, verbose, prefix=True):
+        """Add the elements of the galley fragment `data` (created by 
+        Galley.asBytes) to self.galley. If both the last element of the 
+        galley and the first of the fragment are a TextBox, then it continues
+        the last TextBox, as self.typesetFile would do. The `verbose` warnings 
+        of the file are kept in self.fileVerbose and added to self.verbose, 
+        preceded by the file name. If `prefix` is False, then the warnings 
+        are added as self.typesetFile does, without file name, and only if 
+        they are not in self.verbose yet.
+        """
+        self.flush() # Make sure that existing TextBoxes are built.
+        elements = self.galley.elements
+        fragment = Galley.fromBytes(data)
+        if (elements and fragment.elements and isinstance(elements[-1], TextBox) 
+                and isinstance(fragment.elements[0], TextBox)):
+            elements[-1].bs.append(fragment.elements.pop(0).bs)
+        for e in fragment.elements:
+            self.galley.addElement(e)
+        verbose = list(verbose)
+        if prefix:
+            self.fileVerbose[path] = verbose
+            for message in verbose:
+                self.verbose.append('%s: %s' % (fileNameOf(path), message))
+        else:
+            for message in verbose:
+                if message not in self.verbose: # Warnings only once.
+                    self.verbose.append(message)
+        return self.galley # Answer the galley for convenience of the caller
+
+    def typesetMarkdown(self, md, styles=None, parser=None):
+        """Typeset the markdown string `md` from the events of the markdown
+        parser. The result is the same as typesetting the parsed XML.
+        If `parser` is a MarkdownParser, then it parses `md` incrementally,
+        reusing the unchanged blocks of its previous call. Use galley.diff() 
+        to find the elements that changed.
+
+        >>> md = open('../../../resources/test.md').read()
+        >>> styles = dict(p=dict(font='Georgia'), b=dict(font='Georgia-Bold'))
+        >>> g1 = Typesetter().typesetMarkdown(md, styles)
+        >>> g2 = Typesetter().typeset(parseMarkdown(md), styles)
+        >>> g1.asBytes() == g2.asBytes()
+        True
+        """
+        if parser is not None:
+            return self.typeset(parser.parse(md), styles)
         # Answer the galley for convenience of the caller
-        return self.typeset(xml, styles) 
+        return self.typesetEvents(iterMarkdownEvents(md.splitlines(True)), styles)
 
     def typesetString(self, s, styles):
         s = str(s).replace('<', '%lt;').replace('>', '%gt;')
@@ -93,8 +469,8 @@ class Typesetter:
         >>> from pagebotnano.toolbox.markdown import parseMarkdownFile
         >>> ts = Typesetter()
         >>> g = ts.typesetFile('../../../resources/test.md')
-        >>> ts.verbose[-1]
-        'Node "p" has no supporting style'
+        >>> 'Node "p" has no supporting style' in ts.verbose
+        True
         >>> ts.reset()
         >>> g = ts.typesetFile('../../../resources/images/cookbot1.jpg')
         >>> ts.verbose
@@ -109,44 +485,243 @@ class Typesetter:
         >>> g = ts.typeset(xml)
         >>> ts.verbose[-1]
         'Node "unknownTag" not supported'
+        >>> ts.reset()
+        >>> g = ts.typeset('<xml><x/><x/><y/><x/></xml>')
+        >>> sorted(ts.unknownTags), len(ts.verbose) # Warnings only once for each tag
+        (['x', 'y'], 3)
         """
         self.xml = xml # Store the latest xml for debugging
         root = ET.fromstring(xml)
+        self.assets.refresh() # Find the images that were added since the last run.
+        self.dispatchStyles = None # Compile a new dispatch table for this call.
         self.typesetNode(root, self.galley, styles)
+        self.flush()
+        self.reportMissingImages()
+        return self.galley # Answer the galley for convenience of the caller
+
+    # Cache of (Typesetter class, tag) --> (openHandler, closeHandler) functions.
+    HANDLERS = {}
+
+    @classmethod
+    def getHandlers(cls, tag):
+        """Answer the (openHandler, closeHandler) tuple of functions that 
+        implement the tag in this class. E.g. for a tag name of "img", the 
+        typesetter needs to implement self.node_img for the opening and 
+        self._node_img for the closing of the tag processing. Handlers that
+        don't exist are None. The answer is cached for each class.
+
+        >>> Typesetter.getHandlers('p')[0].__name__
+        'node_p'
+        >>> Typesetter.getHandlers('unknownTag')
+        (None, None)
+        """
+        key = (cls, tag)
+        handlers = cls.HANDLERS.get(key)
+        if handlers is None:
+            nodeSupport = 'node_' + tag
+            cls.HANDLERS[key] = handlers = (getattr(cls, nodeSupport, None), 
+                getattr(cls, '_' + nodeSupport, None))
+        return handlers
+
+    def setStyles(self, styles):
+        """Start a new dispatch table for the `styles` dictionary. Compound 
+        selectors in the styles, such as "h3 b", are compiled once.
+        """
+        self.dispatch = {}
+        self.dispatchStyles = styles
+        self.selectors = getSelectors(styles)
+
+    def getEntry(self, path, styles):
+        """Answer the (openHandler, closeHandler, style) entry of the tuple 
+        of tags `path` (the tag of the node, preceded by the tags of its 
+        parents) from the dispatch table. Compile the entry on first request. 
+        """
+        entry = self.dispatch.get(path)
+        if entry is None:
+            entry = self.compileTag(path, styles)
+        return entry
+
+    def compileTag(self, path, styles):
+        """Add the (openHandler, closeHandler, style) entry of the tag path 
+        to the dispatch table and answer it. The style cascades: the resolved
+        style of the parent path is merged with the style of the tag and then 
+        the styles of matching compound selectors. If there are no styles for 
+        the tag, then it inherits the style of the parent. Resolved styles are
+        immutable Style instances, the `styles` are not altered. Warnings 
+        about missing methods or styles are added to self.verbose once for 
+        each tag.
+
+        >>> styles = {'h3': dict(font='Georgia-Italic', fontSize=18), 'b': dict(font='Georgia-Bold'), 'h3 b': dict(fontSize=20)}
+        >>> ts = Typesetter()
+        >>> ts.setStyles(styles)
+        >>> ts.getEntry(('xml', 'h3', 'b'), styles)[2]
+        {'font': 'Georgia-Bold', 'fontSize': 20, 'tag': 'b'}
+        >>> ts.getEntry(('xml', 'p', 'b'), styles)[2]
+        {'font': 'Georgia-Bold', 'tag': 'b'}
+        >>> ts.getEntry(('xml', 'h3', 'em'), styles)[2] # Inherits from h3
+        {'font': 'Georgia-Italic', 'fontSize': 18, 'tag': 'h3'}
+        >>> styles['b'] # Not altered
+        {'font': 'Georgia-Bold'}
+        >>> ts.verbose
+        ['Node "xml" has no supporting style', 'Node "p" has no supporting style', 'Node "em" has no supporting style']
+        """
+        tag = path[-1]
+        parentStyle = None
+        if len(path) > 1:
+            parentStyle = self.getEntry(path[:-1], styles)[2]
+        tagStyles = [] # Styles of the tag and matching compound selectors.
+        if tag in styles:
+            tagStyles.append(styles[tag])
+        for ancestors, selectorStyle in self.selectors.get(tag, ()):
+            parents = iter(path[:-1])
+            # Ancestors must be in the path in this order, not necessarily adjacent.
+            if all(ancestor in parents for ancestor in ancestors): 
+                tagStyles.append(selectorStyle)
+        if tagStyles:
+            resolved = dict(parentStyle or {})
+            for tagStyle in tagStyles:
+                resolved.update(tagStyle)
+            if not any('tag' in tagStyle for tagStyle in tagStyles):
+                resolved['tag'] = tag
+            style = internStyle(resolved)
+        else:
+            style = parentStyle
+
+        openHandler, closeHandler = self.getHandlers(tag)
+        # Is this tag supported by the typesetter? 
+        if openHandler is None: # The typesetter does not support this kind of tag.
+            if tag not in self.unknownTags:
+                self.unknownTags.add(tag)
+                self.verbose.append('Node "%s" not supported' % tag)
+        elif not tagStyles and tag not in self.unstyledTags: 
+            # No style available for this tag, mark as warning.
+            self.unstyledTags.add(tag)
+            self.verbose.append('Node "%s" has no supporting style' % tag)
+        self.dispatch[path] = entry = (openHandler, closeHandler, style)
+        return entry
+
+    def typesetStream(self, source, styles=None, chunkSize=STREAM_CHUNK_SIZE):
+        """Parse the xml incrementally into TextBox/Image/CodeBlock elements,
+        using the matching styles. The `source` is the path of an XML file, 
+        an open file or an iterable of XML strings. Elements are added to
+        the galley as each node closes. Processed nodes are cleared, so only
+        the open branch of the tree is kept in memory, instead of the whole
+        document and its element tree.
+
+        >>> xml = '<xml><h1>Head</h1><p>Text <b>bold</b> tail</p><python>a = 1</python><p>More</p></xml>'
+        >>> styles = dict(h1=dict(font='Georgia-Bold'), p=dict(font='Georgia'), b=dict(font='Georgia-Bold'))
+        >>> g1 = Typesetter().typeset(xml, styles)
+        >>> g2 = Typesetter().typesetStream([xml[:24], xml[24:50], xml[50:]], styles)
+        >>> g2.elements
+        [<TextBox name=TextBox w=100 h=None>, <CodeBlock code=;a = 1>, <TextBox name=TextBox w=100 h=None>]
+        >>> [e.bs.html for e in g2.elements[::2]] == [e.bs.html for e in g1.elements[::2]]
+        True
+        >>> g2.elements[0].bs.html
+        '<h1>Head</h1><p>Text</p><b>bold tail</b>'
+        >>> import tempfile
+        >>> path = os.path.join(tempfile.mkdtemp(), 'stream.xml')
+        >>> _ = open(path, 'w').write(xml)
+        >>> Typesetter().typesetStream(path, styles).asBytes() == g2.asBytes()
+        True
+        """
+        if isinstance(source, str):
+            f = source = open(source, 'r', encoding='utf-8')
+        else:
+            f = None # Not opened here, so not closed here.
+        try:
+            if hasattr(source, 'read'):
+                source = iter(partial(source.read, chunkSize), '')
+            self.typesetEvents(self._iterXmlEvents(source), styles)
+        finally:
+            if f is not None:
+                f.close()
+        return self.galley # Answer the galley for convenience of the caller
+
+    def _iterXmlEvents(self, chunks):
+        """Generate the ('start', node) and ('end', node) events of the 
+        iterable of XML string `chunks`, parsed incrementally.
+        """
+        parser = ET.XMLPullParser(('start', 'end'))
+        for chunk in chunks:
+            parser.feed(chunk)
+            yield from parser.read_events()
+        parser.close()
+        yield from parser.read_events()
+
+    def typesetEvents(self, events, styles=None):
+        """Typeset the iterable of ('start', node) and ('end', node) events,
+        as answered by ElementTree.XMLPullParser or by markdown 
+        iterMarkdownEvents(). The text of a node must be complete at the 
+        next event, its tail at the event after its end. So the handler of
+        each event is called one event later. Elements are added to the 
+        galley as each node closes. Processed nodes are cleared, so only
+        the open branch of the tree is kept in memory.
+        """
+        if styles is None:
+            styles = {}
+        self.setStyles(styles) # Compile a new dispatch table for this call.
+        self.assets.refresh() # Find the images that were added since the last run.
+        stack = [] # Branch of (node, style, closeHandler, path) of the open nodes.
+        pending = None 
+
+        def close(node, style, closeHandler, path):
+            if closeHandler is not None:
+                closeHandler(self, node, self.galley, style)
+            node.clear() # Done with the node, free its text and children.
+            if stack: 
+                parent = stack[-1][0]
+                if len(parent): # Remove the node from its parent, which is still open.
+                    del parent[0] 
+                if len(stack) == 1 and self.galley.elements: 
+                    # Top block closed, build finished TextBoxes.
+                    self.flush(self.galley.elements[-1])
+
+        for event, node in events:
+            if pending is not None:
+                pending()
+                pending = None
+            if event == 'start':
+                path = (stack[-1][3] if stack else ()) + (node.tag,)
+                openHandler, closeHandler, style = self.getEntry(path, styles)
+                stack.append((node, style, closeHandler, path))
+                if openHandler is not None:
+                    pending = partial(openHandler, self, node, self.galley, style)
+            else: # event == 'end'
+                pending = partial(close, *stack.pop())
+        if pending is not None:
+            pending()
+        self.flush()
+        self.reportMissingImages()
         return self.galley # Answer the galley for convenience of the caller
 
-    def typesetNode(self, node, e, styles=None):
+    def typesetNode(self, node, e, styles=None, parentPath=()):
         """Recursively typeset the etree `node`, using a reference to element `e`.
+        The `parentPath` is the tuple of tags of the parents of the node.
+        The handlers and cascaded style of each tag path are compiled once 
+        in self.dispatch, for the styles that are used.
         """
         # If not dictionary of node-tag styles supplied, then create an empty one.
         if styles is None:
             styles = {}
-        style = styles.get(node.tag) # Search the style for this node. Can be None.
-        if style is not None and 'tag' not in style:
-            style['tag'] = node.tag
-
-        nodeSupport = 'node_'+node.tag
-        # Is this tag supported by the typesetter? If it does, then e.g. for a 
-        # tag name of "img", the typesetter needs to implement self.node_img for
-        # the opening and self._node_img for the closing of the tag processing.
-        if hasattr(self, nodeSupport): 
-            if style is None: # No style available for this tag, mark as warning.
-                self.verbose.append('Node "%s" has no supporting style' % node.tag)
-            # Get the self.node_<node.tag> method and call it with the node,
-            # the `e` (likely to be the galley) and the tag style if it existed.
-            getattr(self, nodeSupport)(node, e, style)
-        else: # The typesetter does not support this kind of tag.
-            self.verbose.append('Node "%s" not supported' % node.tag)
+        if styles is not self.dispatchStyles: # Other styles, compile a new table.
+            self.setStyles(styles)
+        path = parentPath + (node.tag,)
+        openHandler, closeHandler, style = self.getEntry(path, styles)
+
+        if openHandler is not None:
+            # Call the self.node_<node.tag> method with the node, the `e` 
+            # (likely to be the galley) and the tag style if it existed.
+            openHandler(self, node, e, style)
 
         # Typeset all childs node in the current node, by recursive call.
         for child in node:
-            self.typesetNode(child, e, styles)
+            self.typesetNode(child, e, styles, path)
 
-        if hasattr(self, '_'+nodeSupport): # Is this tag supported?
-            # Get the typesetter method that knows how to handle the closing
-            # of this tag and call it with the node, the `e` (likely to be the galley)
+        if closeHandler is not None: 
+            # Call the typesetter method that knows how to handle the closing
+            # of this tag with the node, the `e` (likely to be the galley)
             # and the style if it existed.
-            getattr(self, '_'+nodeSupport)(node, e, style)
+            closeHandler(self, node, e, style)
 
     def getTextBox(self, e=None):
         """Answer the last TextBox element if it exists. 
@@ -171,6 +746,61 @@ class Typesetter:
             e.addElement(TextBox('', x=0, y=0, w=e.w or DEFAULT_WIDTH))
         return e.elements[-1]
 
+    def addText(self, e, s, style):
+        """Add the string `s` with style to the last TextBox in `e`. The text
+        is collected by a BabelStringBuilder for each TextBox, so the 
+        BabelString is built once, when self.flush() is called. Empty or
+        undefined `s`, such as node.text of a tag that starts with a child
+        tag, is ignored.
+
+        >>> ts = Typesetter()
+        >>> ts.addText(ts.galley, 'Hello', dict(font='Georgia'))
+        >>> ts.addText(ts.galley, ' world', None)
+        >>> tb = ts.getTextBox()
+        >>> tb.bs.runs[-1].s # Not built yet
+        ''
+        >>> ts.flush()
+        >>> tb.bs.runs[-1].s
+        'Hello world'
+        >>> ts.addText(ts.galley, None, None)
+        >>> ts.flush()
+        >>> tb.bs.s
+        'Hello world'
+        >>> xml = '<xml><p><b>Bold</b> text</p></xml>'
+        >>> styles = dict(p=dict(font='Georgia'), b=dict(font='Georgia-Bold'))
+        >>> Typesetter().typeset(xml, styles).elements[0].bs.s
+        'Bold text'
+        """
+        if not s:
+            return
+        tb = self.getTextBox(e)
+        builder = self.builders.get(tb)
+        if builder is None:
+            self.builders[tb] = builder = BabelStringBuilder()
+        builder.append(s, style)
+
+    def flush(self, keep=None):
+        """Build the BabelString of all TextBoxes that have collected text.
+        If `keep` is defined, then that TextBox continues collecting.
+        The collected runs are appended to the BabelString of the TextBox,
+        so the existing runs are not copied again.
+
+        >>> ts = Typesetter()
+        >>> ts.addText(ts.galley, 'Hello', dict(font='Georgia'))
+        >>> ts.flush()
+        >>> ts.addText(ts.galley, ' world', dict(font='Georgia-Bold'))
+        >>> ts.flush()
+        >>> [run.s for run in ts.getTextBox().bs.runs] # Empty run of the new TextBox
+        ['', 'Hello', ' world']
+        """
+        builders = {}
+        for tb, builder in self.builders.items():
+            if tb is keep:
+                builders[tb] = builder
+            else:
+                tb.bs.append(builder.build()) # Only copies the new runs.
+        self.builders = builders
+
     def getCodeBlock(self, e=None):
         """Answer the last Codeblock element if it exists. 
         Otherwise create it first.
@@ -194,14 +824,48 @@ class Typesetter:
         """Root of the xml tree. Ignore."""
         pass
 
+    def reportMissingImages(self):
+        """Add the image references that could not be resolved by self.assets
+        to self.verbose, as a single warning, if it is not there yet.
+
+        >>> ts = Typesetter()
+        >>> g = ts.typeset('<xml><img src="a.jpg"/><img src="b.jpg"/><img src="a.jpg"/></xml>')
+        >>> ts.verbose[-1]
+        'Images do not exist: "a.jpg", "b.jpg"'
+        >>> len(g.elements)
+        0
+        """
+        if self.missingImages:
+            message = 'Images do not exist: %s' % ', '.join('"%s"' % path 
+                for path in self.missingImages)
+            if message not in self.verbose:
+                self.verbose.append(message)
+            self.missingImages = []
+
     def node_img(self, node, e, style):
-        """Add a new image to the galley
+        """Add a new image to the galley. The path is resolved by self.assets,
+        missing images are reported together by self.reportMissingImages().
+
+        >>> from pagebotnano.toolbox.assetresolver import AssetResolver
+        >>> ts = Typesetter(assets=AssetResolver(['../../../resources']))
+        >>> g = ts.typeset('<xml><img src="images/cookbot1.jpg"/><img src="images/cookbot2.jpg"/></xml>')
+        >>> g.elements, ts.assets.scans
+        ([<Image file=cookbot1.jpg w=None h=None>, <Image file=cookbot2.jpg w=None h=None>], 2)
+        >>> import shutil, tempfile
+        >>> folder = tempfile.mkdtemp()
+        >>> xml = '<xml><img src="%s/a.jpg"/></xml>' % folder
+        >>> len(ts.typeset(xml).elements)
+        2
+        >>> _ = shutil.copy('../../../resources/images/cookbot1.jpg', os.path.join(folder, 'a.jpg'))
+        >>> len(ts.typeset(xml).elements) # Added image is found by the next run.
+        3
         """
         path = node.attrib.get('src')
-        if os.path.exists(path):
-            e.addElement(Image(path))
-        else:
-            self.verbose.append('Image "%s" does not exist.' % path)
+        resolved = self.assets.resolve(path)
+        if resolved is not None:
+            e.addElement(Image(resolved, resolved=True))
+        elif path not in self.missingImages:
+            self.missingImages.append(path)
 
     def _node_img(self, node, e, style):
         pass
@@ -221,16 +885,14 @@ class Typesetter:
         >>> ts.galley.elements[-1].bs.html # Reconstruct the html from the runs.
         '<p>This is a tagged text</p>'
         """
-        tb = self.getTextBox(e)
-        tb.bs.append(node.text, style)
+        self.addText(e, node.text, style)
 
     def _node_p(self, node, e, style):
         """Close the <p> with any text that is still in the node.tail.
         Always add a return (which will be removed on reconstruction of the bs.html)
         """
         if node.tail:
-            tb = self.getTextBox(e)
-            tb.bs.append(node.tail, style) # Must be style of the parent.
+            self.addText(e, node.tail, style) # Must be style of the parent.
 
     def node_h1(self, node, e, style):
         """Add a new "h1" head to the last TextBox in the galley.
@@ -248,151 +910,119 @@ class Typesetter:
         >>> ts.galley.elements[-1].bs.html # Reconstruct the html from the runs.
         '<h1>Head</h1><p>This is a tagged text</p>'
         """
-        tb = self.getTextBox(e)
-        tb.bs.append(node.text, style)
+        self.addText(e, node.text, style)
 
     def _node_h1(self, node, e, style):
         """Close the <h1> with any text that is still in the node.tail.
         Always add a return (which will be removed on reconstruction of the bs.html)
         """
         if node.tail:
-            tb = self.getTextBox(e)
-            tb.bs.append(node.tail, style) # Must be style of the parent.
+            self.addText(e, node.tail, style) # Must be style of the parent.
 
     def node_h2(self, node, e, style):
-        tb = self.getTextBox(e)
-        tb.bs.append(node.text, style)
+        self.addText(e, node.text, style)
 
     def _node_h2(self, node, e, style):
         if node.tail:
-            tb = self.getTextBox(e)
-            tb.bs.append(node.tail, style) # Must be style of the parent.
+            self.addText(e, node.tail, style) # Must be style of the parent.
 
     def node_h3(self, node, e, style):
-        tb = self.getTextBox(e)
-        tb.bs.append(node.text, style)
+        self.addText(e, node.text, style)
 
     def _node_h3(self, node, e, style):
         if node.tail:
-            tb = self.getTextBox(e)
-            tb.bs.append(node.tail, style) # Must be style of the parent.
+            self.addText(e, node.tail, style) # Must be style of the parent.
 
     def node_h4(self, node, e, style):
-        tb = self.getTextBox(e)
-        tb.bs.append(node.text, style)
+        self.addText(e, node.text, style)
 
     def _node_h4(self, node, e, style):
         if node.tail:
-            tb = self.getTextBox(e)
-            tb.bs.append(node.tail, style) # Must be style of the parent.
+            self.addText(e, node.tail, style) # Must be style of the parent.
 
     def node_h5(self, node, e, style):
-        tb = self.getTextBox(e)
-        tb.bs.append(node.text, style)
+        self.addText(e, node.text, style)
 
     def _node_h5(self, node, e, style):
         if node.tail:
-            tb = self.getTextBox(e)
-            tb.bs.append(node.tail, style) # Must be style of the parent.
+            self.addText(e, node.tail, style) # Must be style of the parent.
 
     def node_h6(self, node, e, style):
-        tb = self.getTextBox(e)
-        tb.bs.append(node.text, style)
+        self.addText(e, node.text, style)
 
     def _node_h6(self, node, e, style):
         if node.tail:
-            tb = self.getTextBox(e)
-            tb.bs.append(node.tail, style) # Must be style of the parent.
+            self.addText(e, node.tail, style) # Must be style of the parent.
 
     def node_em(self, node, e, style):
-        tb = self.getTextBox(e)
-        tb.bs.append(node.text, style)
+        self.addText(e, node.text, style)
 
     def _node_em(self, node, e, style):
         if node.tail:
-            tb = self.getTextBox(e)
-            tb.bs.append(node.tail, style) # Must be style of the parent.
+            self.addText(e, node.tail, style) # Must be style of the parent.
 
     def node_a(self, node, e, style):
-        tb = self.getTextBox(e)
-        tb.bs.append(node.text, style)
+        self.addText(e, node.text, style)
 
     def _node_a(self, node, e, style):
         if node.tail:
-            tb = self.getTextBox(e)
-            tb.bs.append(node.tail, style) # Must be style of the parent.
+            self.addText(e, node.tail, style) # Must be style of the parent.
 
     def node_b(self, node, e, style):
-        tb = self.getTextBox(e)
-        tb.bs.append(node.text, style)
+        self.addText(e, node.text, style)
 
     def _node_b(self, node, e, style):
         if node.tail:
-            tb = self.getTextBox(e)
-            tb.bs.append(node.tail, style) # Must be style of the parent.
+            self.addText(e, node.tail, style) # Must be style of the parent.
 
     def node_ul(self, node, e, style):
-        tb = self.getTextBox(e)
-        tb.bs.append(node.text, style)
+        self.addText(e, node.text, style)
 
     def _node_ul(self, node, e, style):
         if node.tail:
-            tb = self.getTextBox(e)
-            tb.bs.append(node.tail, style) # Must be style of the parent.
+            self.addText(e, node.tail, style) # Must be style of the parent.
 
     def node_ol(self, node, e, style):
-        tb = self.getTextBox(e)
-        tb.bs.append(node.text, style)
+        self.addText(e, node.text, style)
 
     def _node_ol(self, node, e, style):
         if node.tail:
-            tb = self.getTextBox(e)
-            tb.bs.append(node.tail, style) # Must be style of the parent.
+            self.addText(e, node.tail, style) # Must be style of the parent.
 
     def node_li(self, node, e, style):
-        tb = self.getTextBox(e)
-        tb.bs.append(node.text, style)
+        self.addText(e, node.text, style)
 
     def _node_li(self, node, e, style):
         if node.tail:
-            tb = self.getTextBox(e)
-            tb.bs.append(node.tail, style) # Must be style of the parent.
+            self.addText(e, node.tail, style) # Must be style of the parent.
 
     def node_strong(self, node, e, style):
-        tb = self.getTextBox(e)
-        tb.bs.append(node.text, style)
+        self.addText(e, node.text, style)
 
     def _node_strong(self, node, e, style):
         if node.tail:
-            tb = self.getTextBox(e)
-            tb.bs.append(node.tail, style) # Must be style of the parent.
+            self.addText(e, node.tail, style) # Must be style of the parent.
 
     def node_i(self, node, e, style):
-        tb = self.getTextBox(e)
-        tb.bs.append(node.text, style)
+        self.addText(e, node.text, style)
 
     def _node_i(self, node, e, style):
         if node.tail:
-            tb = self.getTextBox(e)
-            tb.bs.append(node.tail, style) # Must be style of the parent.
+            self.addText(e, node.tail, style) # Must be style of the parent.
 
     def node_hr(self, node, e, style):
-        tb = self.getTextBox(e)
-        tb.bs.append(node.text, style)
+        self.addText(e, node.text, style)
 
     def _node_hr(self, node, e, style):
         if node.tail:
-            tb = self.getTextBox(e)
-            tb.bs.append(node.tail, style) # Must be style of the parent.
+            self.addText(e, node.tail, style) # Must be style of the parent.
 
     def node_code(self, node, e, style):
-        tb = self.getTextBox(e)
-        tb.bs.append(node.text, style)
+        self.addText(e, node.text, style)
 
     def _node_code(self, node, e, style):
         if node.tail:
-            tb = self.getTextBox(e)
-            tb.bs.append(node.tail, style) # Must be style of the parent.
+            self.addText(e, node.tail, style) # Must be style of the parent.
 
     def node_python(self, node, e, style):
         tb = self.getCodeBlock(e)
@@ -400,12 +1030,10 @@ class Typesetter:
 
     def _node_python(self, node, e, style):
         if node.tail:
-            tb = self.getTextBox(e)
-            tb.bs.append(node.tail, style) # Must be style of the parent.
+            self.addText(e, node.tail, style) # Must be style of the parent.
 
     def node_br(self, node, e, style):
-        tb = self.getTextBox(e)
-        tb.bs.append(node.text, style)
+        self.addText(e, node.text, style)
 
     def _node_br(self, node, e, styles):
         pass